@@ -0,0 +1,316 @@
+# Benchmark / load generator for the Multi-Paxos servers.
+#
+# Starts N server processes on localhost ports (each with its own data
+# directory), drives SubmitValue / get_value load against them and writes
+# throughput and p50/p99/p999 latency to a JSON file. Pass --baseline with
+# an earlier result file to print the change against it.
+#
+#   closed loop: each of --clients connections keeps --depth requests in
+#                flight, sending the next one as soon as one returns
+#   open loop:   requests arrive at --rate per second (Poisson), whether or
+#                not earlier ones have finished; latency is measured from the
+#                scheduled arrival time, so queueing shows up in the numbers
+#
+# Contention is set with --proposers: clients are spread over the first K
+# nodes, so K=1 sends every write to one node and K=N makes all nodes propose.
+# With --smart every client uses paxos_client.ClusterClient instead, which
+# sends each request to the leader of its group.
+#
+# --workload kv sends put/get on random keys (out of --keys) instead, which
+# spreads the writes over the servers' key-value Paxos groups (--shards).
+#
+# Run:  python3 paxos-bench.py [--nodes 3] [--phase1-quorum Q1 --phase2-quorum Q2]
+#                              [--clients 8] [--depth 1] [--proposers 1]
+#                              [--workload register|kv] [--shards 8] [--keys 10000]
+#                              [--duration 10] [--reads 0.0] [--mode closed]
+#                              [--out paxos-bench.json] [--baseline old.json]
+
+import argparse
+import json
+import os
+import queue
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from multiprocessing.connection import Client
+from concurrent.futures import Future
+from functools import partial
+from threading import Thread, Event, Semaphore
+
+from paxos_client import RPCProxy, ClusterClient
+
+AUTHKEY = b'peekaboo'
+SERVER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "paxos-server-test.py")
+
+
+class SyncCalls:
+    """call_async() on top of ClusterClient's blocking methods, so --smart clients send one request at a time."""
+    def __init__(self, client):
+        self._client = client
+
+    def call_async(self, name, *args):
+        fut = Future()
+        try:
+            fut.set_result(getattr(self._client, name)(*args))
+        except Exception as e:
+            fut.set_exception(e)
+        return fut
+
+    def close(self):
+        self._client.close()
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return 0.0
+    k = min(len(sorted_values) - 1, int(round(p / 100 * (len(sorted_values) - 1))))
+    return sorted_values[k]
+
+
+def summarize(latencies, elapsed):
+    latencies = sorted(latencies)
+    return {
+        "count": len(latencies),
+        "throughput": len(latencies) / elapsed if elapsed else 0.0,
+        "p50_ms": percentile(latencies, 50) * 1e3,
+        "p99_ms": percentile(latencies, 99) * 1e3,
+        "p999_ms": percentile(latencies, 99.9) * 1e3,
+    }
+
+
+# ---------- Cluster ----------
+
+def start_cluster(nodes, base_port, server_mode, data_dir, verbose, quorums=(None, None), extra_args=()):
+    addresses = [("127.0.0.1", base_port + i) for i in range(nodes)]
+    peers = ",".join(f"{host}:{port}" for host, port in addresses)
+    procs = []
+    for i, (_, port) in enumerate(addresses):
+        cmd = [sys.executable, SERVER, "--node-id", str(i + 1), "--peers", peers,
+               "--port", str(port), "--data-dir", os.path.join(data_dir, f"node{i + 1}"),
+               "--server-mode", server_mode]
+        for flag, size in zip(("--phase1-quorum", "--phase2-quorum"), quorums):
+            if size:
+                cmd += [flag, str(size)]
+        cmd += extra_args
+        out = None if verbose else subprocess.DEVNULL
+        procs.append(subprocess.Popen(cmd, stdout=out, stderr=out))
+
+    # Wait until every node accepts connections
+    deadline = time.monotonic() + 10
+    for addr in addresses:
+        while True:
+            try:
+                Client(addr, authkey=AUTHKEY).close()
+                break
+            except OSError:
+                if time.monotonic() > deadline:
+                    stop_cluster(procs)
+                    raise RuntimeError(f"node at {addr} did not start")
+                time.sleep(0.05)
+    return addresses, procs
+
+
+def stop_cluster(procs):
+    for p in procs:
+        p.terminate()
+    for p in procs:
+        try:
+            p.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            p.kill()
+
+
+# ---------- Load ----------
+
+def run_load(args, addresses):
+    targets = addresses[:max(1, min(args.proposers, len(addresses)))]
+    stop = Event()
+    measuring = Event()
+    write_latencies = [[] for _ in range(args.clients)]
+    read_latencies = [[] for _ in range(args.clients)]
+    errors = [0] * args.clients
+    arrivals = queue.Queue() if args.mode == "open" else None
+
+    def one_request(proxy, rng, c, i):
+        """Send one request; returns its Future, the latency list it counts towards and
+        whether the reply is a SubmitValue result string to check."""
+        staleness = () if args.max_staleness is None else (args.max_staleness,)
+        if args.workload == "kv":
+            key = f"key{rng.randrange(args.keys)}"
+            if rng.random() < args.reads:
+                return proxy.call_async("get", key, *staleness), read_latencies[c], False
+            return proxy.call_async("put", key, f"client {c} value {i}"), write_latencies[c], False
+        if rng.random() < args.reads:
+            return proxy.call_async("get_value", *staleness), read_latencies[c], False
+        return proxy.call_async("SubmitValue", f"client {c} value {i}"), write_latencies[c], True
+
+    def client(c):
+        if args.smart:
+            proxy = SyncCalls(ClusterClient(addresses))
+        else:
+            proxy = RPCProxy(Client(targets[c % len(targets)], authkey=AUTHKEY))
+        rng = random.Random(c)
+        # At most --depth requests in flight on this connection
+        window = Semaphore(args.depth)
+
+        def done(start, bucket, check, fut):
+            # Runs on the proxy's reader thread
+            window.release()
+            try:
+                result = fut.result()
+                if check and "SUCCEEDED" not in result:
+                    raise RuntimeError(result)
+            except Exception:
+                if measuring.is_set():
+                    errors[c] += 1
+            else:
+                if measuring.is_set():
+                    bucket.append(time.perf_counter() - start)
+
+        def acquire():
+            """Wait for a free slot in the window; False once the run is over."""
+            while not window.acquire(timeout=0.1):
+                if stop.is_set():
+                    return False
+            return True
+
+        i = 0
+        while not stop.is_set():
+            if arrivals is not None:
+                try:
+                    start = arrivals.get(timeout=0.1)
+                except queue.Empty:
+                    continue
+                delay = start - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                # Waiting for a free slot in the window counts towards the latency
+                if not acquire():
+                    break
+            else:
+                if not acquire():
+                    break
+                start = time.perf_counter()
+            try:
+                fut, bucket, check = one_request(proxy, rng, c, i)
+            except Exception:
+                window.release()
+                if measuring.is_set():
+                    errors[c] += 1
+            else:
+                fut.add_done_callback(partial(done, start, bucket, check))
+            i += 1
+        proxy.close()
+
+    def generator():
+        rng = random.Random(-1)
+        next_arrival = time.perf_counter()
+        while not stop.is_set():
+            next_arrival += rng.expovariate(args.rate)
+            delay = next_arrival - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            arrivals.put(next_arrival)
+
+    threads = [Thread(target=client, args=(c,), daemon=True) for c in range(args.clients)]
+    if arrivals is not None:
+        threads.append(Thread(target=generator, daemon=True))
+    for t in threads:
+        t.start()
+
+    time.sleep(args.warmup)
+    measuring.set()
+    start = time.perf_counter()
+    time.sleep(args.duration)
+    measuring.clear()
+    elapsed = time.perf_counter() - start
+    stop.set()
+    for t in threads:
+        t.join(timeout=5)
+
+    writes = [x for per_client in write_latencies for x in per_client]
+    reads = [x for per_client in read_latencies for x in per_client]
+    return {
+        "elapsed": elapsed,
+        "errors": sum(errors),
+        "write": summarize(writes, elapsed),
+        "read": summarize(reads, elapsed),
+    }
+
+
+# ---------- Report ----------
+
+def print_results(results, baseline=None):
+    print(f"{'op':<6} {'count':>8} {'ops/s':>10} {'p50 ms':>8} {'p99 ms':>8} {'p999 ms':>8}")
+    for op in ("write", "read"):
+        r = results[op]
+        if not r["count"]:
+            continue
+        print(f"{op:<6} {r['count']:>8} {r['throughput']:>10.0f} {r['p50_ms']:>8.2f} {r['p99_ms']:>8.2f} {r['p999_ms']:>8.2f}")
+        if baseline and baseline.get(op, {}).get("count"):
+            b = baseline[op]
+            change = lambda key: (r[key] - b[key]) / b[key] * 100 if b[key] else 0.0
+            print(f"{'  vs':<6} {'':>8} {change('throughput'):>+9.1f}% {change('p50_ms'):>+7.1f}% "
+                  f"{change('p99_ms'):>+7.1f}% {change('p999_ms'):>+7.1f}%")
+    print(f"errors: {results['errors']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Multi-Paxos throughput and latency benchmark")
+    parser.add_argument("--nodes", type=int, default=3, help="servers to start on localhost")
+    parser.add_argument("--base-port", type=int, default=17100, help="node i listens on base-port + i")
+    parser.add_argument("--server-mode", choices=("threaded", "asyncio"), default="threaded")
+    parser.add_argument("--phase1-quorum", type=int, help="passed to every server (default: majority)")
+    parser.add_argument("--phase2-quorum", type=int, help="passed to every server (default: majority)")
+    parser.add_argument("--thrifty", action="store_true", help="run the servers in thrifty mode")
+    parser.add_argument("--workload", choices=("register", "kv"), default="register",
+                        help="SubmitValue/get_value on the replicated file, or put/get on the key-value store")
+    parser.add_argument("--shards", type=int, help="key-value Paxos groups per server (default: the server's)")
+    parser.add_argument("--keys", type=int, default=10000, help="kv workload: number of distinct keys")
+    parser.add_argument("--clients", type=int, default=8, help="client connections (closed loop: concurrency)")
+    parser.add_argument("--depth", type=int, default=1,
+                        help="requests each client keeps in flight on its connection (pipelining)")
+    parser.add_argument("--smart", action="store_true",
+                        help="clients use ClusterClient (leader routing over all nodes) instead of --proposers")
+    parser.add_argument("--proposers", type=int, default=1, help="spread clients over this many nodes")
+    parser.add_argument("--mode", choices=("closed", "open"), default="closed")
+    parser.add_argument("--rate", type=float, default=500.0, help="open loop: requests per second")
+    parser.add_argument("--reads", type=float, default=0.0, help="fraction of requests that are reads")
+    parser.add_argument("--max-staleness", type=float, default=None,
+                        help="pass max_staleness to get_value/get (bounded-staleness reads)")
+    parser.add_argument("--warmup", type=float, default=1.0, help="seconds of load before measuring")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds to measure")
+    parser.add_argument("--out", default="paxos-bench.json", help="where to write the results")
+    parser.add_argument("--baseline", help="earlier result file to compare against")
+    parser.add_argument("--verbose", action="store_true", help="show server output")
+    args = parser.parse_args()
+
+    extra_args = ["--thrifty"] if args.thrifty else []
+    if args.shards is not None:
+        extra_args += ["--shards", str(args.shards)]
+    data_dir = tempfile.mkdtemp(prefix="paxos-bench-")
+    addresses, procs = start_cluster(args.nodes, args.base_port, args.server_mode, data_dir, args.verbose,
+                                     (args.phase1_quorum, args.phase2_quorum), extra_args)
+    try:
+        results = run_load(args, addresses)
+    finally:
+        stop_cluster(procs)
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+    report = {"config": vars(args), "results": results}
+    with open(args.out, "w") as f:
+        json.dump(report, f, indent=2)
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)["results"]
+    print_results(results, baseline)
+    print(f"results written to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,17 +1,7 @@
-import pickle
 from multiprocessing.connection import Client
 
-class RPCProxy:
-    def __init__(self, connection):
-        self._connection = connection
-    def __getattr__(self, name):
-        def do_rpc(*args, **kwargs):
-            self._connection.send(pickle.dumps((name, args, kwargs)))
-            result = pickle.loads(self._connection.recv())
-            if isinstance(result, Exception):
-                raise result
-            return result
-        return do_rpc
+# RPCProxy lives in paxos_client.py; it can keep many calls in flight on one connection
+from paxos_client import RPCProxy
 
 
 if __name__ == "__main__":
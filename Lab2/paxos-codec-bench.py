@@ -0,0 +1,86 @@
+# Micro-benchmark: old double-pickle RPC framing vs. paxos_codec frames.
+#
+# For a few typical Paxos messages this measures, per call:
+#   - encode + decode CPU time on each side (no network)
+#   - a full send/recv over a local multiprocessing Pipe
+#   - bytes on the wire (payload, excluding the Connection's own 4-byte length)
+#
+# Run:  python3 paxos-codec-bench.py [iterations]
+
+import pickle
+import sys
+import time
+from multiprocessing import Pipe
+
+from paxos_codec import encode_request, decode_request, encode_reply, decode_reply, FUNCTION_IDS
+
+MESSAGES = [
+    ("prepare request", ("prepare", (1234567, 42), {})),
+    ("accept request", ("accept", (1234567, "Hello from clientA", 42), {})),
+    ("promise reply", ("prepare", {40: (1234567, "Hello from clientA"), 41: (1234567, "value 2")})),
+    ("accepted reply", ("accept", ("accepted", 1234567))),
+]
+
+
+def old_request(msg):
+    # What the original RPCProxy / _call_remote did: pickle, then Connection.send pickles again
+    return pickle.dumps(pickle.dumps(msg))
+
+
+def old_decode(raw):
+    return pickle.loads(pickle.loads(raw))
+
+
+def timed(fn, iterations):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    return (time.perf_counter() - start) / iterations * 1e6
+
+
+def bench(name, msg, iterations):
+    is_request = len(msg) == 3
+    if is_request:
+        func_name, args, kwargs = msg
+        new_encode = lambda: encode_request(7, func_name, args, kwargs)
+        new_decode = decode_request
+    else:
+        func_name, result = msg
+        new_encode = lambda: encode_reply(7, FUNCTION_IDS[func_name], result)
+        new_decode = decode_reply
+
+    old_bytes = len(old_request(msg))
+    new_bytes = len(new_encode())
+
+    old_cpu = timed(lambda: old_decode(old_request(msg)), iterations)
+    new_cpu = timed(lambda: new_decode(new_encode()), iterations)
+
+    a, b = Pipe()
+
+    def old_pipe():
+        a.send(pickle.dumps(msg))
+        pickle.loads(b.recv())
+
+    def new_pipe():
+        a.send_bytes(new_encode())
+        new_decode(b.recv_bytes())
+
+    old_rt = timed(old_pipe, iterations)
+    new_rt = timed(new_pipe, iterations)
+    a.close()
+    b.close()
+
+    print(f"{name:<16} {old_bytes:>6} {new_bytes:>6}   {old_cpu:>7.2f} {new_cpu:>7.2f}   {old_rt:>7.2f} {new_rt:>7.2f}")
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    print(f"{iterations} iterations per measurement; times in microseconds per call")
+    print(f"{'message':<16} {'bytes':>13}   {'encode+decode':>15}   {'pipe send+recv':>15}")
+    print(f"{'':<16} {'pickle':>6} {'codec':>6}   {'pickle':>7} {'codec':>7}   {'pickle':>7} {'codec':>7}")
+    for name, msg in MESSAGES:
+        bench(name, msg, iterations)
+
+
+if __name__ == "__main__":
+    main()
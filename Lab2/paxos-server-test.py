@@ -1,258 +1,1724 @@
-import pickle
 import os
 import time
 import random
-from multiprocessing.connection import Listener, Client
-from threading import Thread
+import socket
+import struct
+import asyncio
+import json
+import argparse
+import zlib
+from functools import partial
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Listener, Connection, answer_challenge, deliver_challenge
+from threading import Thread, Lock, RLock, Semaphore, BoundedSemaphore, Condition
+from concurrent.futures import ThreadPoolExecutor, Future, wait, FIRST_COMPLETED
+
+from paxos_codec import (HEADER, FUNCTION_IDS, CodecError, encode_request, decode_request,
+                         encode_reply, encode_error, decode_reply)
+from paxos_wal import WriteAheadLog, read_records, decode_records, write_atomic
+from paxos_stats import Stats, MODES
+from paxos_store import AcceptorLog
 
 # ---------- Generic RPC handler (unchanged pattern) ----------
 
 class RPCHandler:
     def __init__(self):
         self._functions = { }
+        self._blocking = set()
 
-    def register_function(self, func):
+    def register_function(self, func, blocking=False):
+        """
+        blocking=True marks RPCs that wait on other nodes (e.g. SubmitValue),
+        on the disk or on a group's state_lock, which decide holds while it
+        writes the replica and snapshots; the asyncio server runs those on
+        worker threads instead of the loop.
+        """
         self._functions[func.__name__] = func
+        if blocking:
+            self._blocking.add(func.__name__)
+
+    def is_blocking(self, func_name):
+        return func_name in self._blocking
+
+    def call(self, call_id, func_name, args, kwargs):
+        """Run one decoded request and return the encoded reply frame."""
+        func_id = FUNCTION_IDS[func_name]
+        start = time.perf_counter()
+        try:
+            r = self._functions[func_name](*args, **kwargs)
+            reply = encode_reply(call_id, func_id, r)
+        except Exception as e:
+            stats.incr("rpc_errors")
+            reply = encode_error(call_id, func_id, e)
+        stats.record("rpc." + func_name, time.perf_counter() - start)
+        return reply
+
+    def handle_connection(self, connection, workers=None):
+        """
+        Serve one client connection. Replies carry the request's call id, so
+        with a workers pool, blocking RPCs run there while this thread reads
+        the next request, and their replies go out whenever they finish.
+        """
+        send_lock = Lock()
+
+        def send(frame):
+            with send_lock:
+                connection.send_bytes(frame)
+
+        def run(call_id, func_name, args, kwargs):
+            try:
+                send(self.call(call_id, func_name, args, kwargs))
+            except OSError:
+                # The client went away before its reply was ready
+                pass
 
-    def handle_connection(self, connection):
         try:
             while True:
-                # Receive a message (already unpickled once by connection)
-                func_name, args, kwargs = pickle.loads(connection.recv())
+                # Receive one binary frame and decode it once (see paxos_codec.py)
+                call_id, func_name, args, kwargs = decode_request(connection.recv_bytes())
                 # Run the RPC and send a response
-                try:
-                    r = self._functions[func_name](*args, **kwargs)
-                    connection.send(pickle.dumps(r))
-                except Exception as e:
-                    connection.send(pickle.dumps(e))
-        except EOFError:
+                if workers is not None and func_name in self._blocking:
+                    workers.submit(run, call_id, func_name, args, kwargs)
+                else:
+                    send(self.call(call_id, func_name, args, kwargs))
+        except (EOFError, ConnectionResetError, CodecError):
             pass
 
 # Server Nodes 
-# Adjust these constants for each node in your cluster.
-# Example:
+# Adjust these constants for each node in your cluster, or leave them and
+# pass --config cluster.json --node-id N instead (see _load_config).
+# NODE_ID is this node's position in ALL_NODES, counting from 1:
 #   Node 1: NODE_ID = 1, NODE_INDEX = 0
-#   Node 2: NODE_ID = 2, NODE_INDEX = 1
-#   Node 3: NODE_ID = 3, NODE_INDEX = 2
+#   Node N: NODE_ID = N, NODE_INDEX = N - 1
 
-NODE_ID = 3          # CHANGE per node (1, 2, or 3)
+NODE_ID = 3          # CHANGE per node (1 to len(ALL_NODES))
 NODE_INDEX = NODE_ID - 1
 
-# All three node addresses in the cluster (from Lab-1).
-# Update these to match your VM IPs.
+# Every node address in the cluster, in NODE_ID order (the default is the
+# three VMs from Lab-1). Update these to match your VM IPs, or list any
+# number of nodes in cluster.json.
 ALL_NODES = [
     ('10.128.0.2', 17000),
     ('10.128.0.3', 17000),
     ('10.128.0.5', 17000),
 ]
 
+# Quorum sizes. They only have to intersect (PHASE1_QUORUM + PHASE2_QUORUM
+# > number of nodes), so a cluster can commit with a small Phase 2 quorum
+# and pay for a larger Phase 1 quorum only when the leader changes.
+PHASE1_QUORUM = 2        # promises needed to become leader
+PHASE2_QUORUM = 2        # accepts needed to choose a value (and lease grants)
+
+# Proposal numbers are counter * PROPOSAL_STRIDE + NODE_ID, so NODE_ID must stay below it
+PROPOSAL_STRIDE = 100
+
 AUTHKEY = b'peekaboo'
 FILE_NAME = "CISC5597"   # replicated file name (one per node)
-MAJORITY = 2             # for 3 nodes
+WAL_FILE = FILE_NAME + ".wal"   # acceptor write-ahead log (promises and accepts)
+SNAPSHOT_FILE = FILE_NAME + ".snap"   # replica state as of snapshot_slot
+SNAPSHOT_INTERVAL = 1000 # applied slots between snapshots
+CATCH_UP_INTERVAL = 1.0  # seconds between attempts to catch up from a peer
+CATCH_UP_BATCH = 500     # chosen slots fetched per get_decided call
+LEASE_DURATION = 2.0     # seconds an acceptor backs the leader it last accepted from
+LEASE_MARGIN = 0.1       # seconds the leader gives up early to cover clock drift
+FORWARD_TIMEOUT = 10.0   # seconds to wait for the leader to answer a forwarded request
 
-# Paxos per-node state
-promised_n = None        # highest proposal number promised
-accepted_n = None        # highest proposal number accepted
-accepted_value = None    # value associated with accepted_n
+# Contention: a proposer that was rejected retries after a random delay
+# drawn from [0, min(BACKOFF_MAX, BACKOFF_BASE * 2**attempt)]
+MAX_ATTEMPTS = 5
+BACKOFF_BASE = 0.01
+BACKOFF_MAX = 1.0
+RPC_TIMEOUT = 1.0        # seconds to wait for any single peer reply
+CONNECT_TIMEOUT = 1.0    # seconds to wait for a peer to accept a connection
+BATCH_MAX_SIZE = 64      # most client values committed together in one slot
+BATCH_LINGER = 0.001     # seconds to wait for more values before proposing a batch
+PIPELINE_WINDOW = 8      # log slots the leader keeps in flight at once
+POOL_SIZE = 8            # max open connections kept to each peer
+HEALTH_CHECK_INTERVAL = 5.0   # idle peer connections are pinged this often
 
-# Local proposal counter for this node (used when acting as proposer)
-proposal_counter = 0
+# Thrifty mode: send prepare/accept only to the fastest quorum of peers
+# (ranked by round-trip time) and bring in the rest only if one of them
+# fails or has not answered within THRIFTY_RTT_FACTOR times its usual RTT
+THRIFTY = False
+THRIFTY_RTT_FACTOR = 4
+THRIFTY_MIN_WAIT = 0.01  # seconds; never fall back sooner than this
+RTT_ALPHA = 0.2          # weight of the newest sample in each peer's RTT average
 
-#File Creation
-def _init_file():
-    """Ensure the replicated file exists."""
-    if not os.path.exists(FILE_NAME):
-        with open(FILE_NAME, "w") as f:
-            f.write("")
+# Key-value store: keys are hash-partitioned over this many independent
+# Paxos groups, each with its own log, WAL and leader (see PaxosGroup).
+# Shard i prefers node i (mod the cluster size) as its leader, so one shard
+# per node spreads the write load; every node must use the same value.
+KV_SHARDS = 3
 
+# Entry used to fill log gaps found during leader recovery
+NOOP = None
 
-_init_file()
+# Counters and latency histograms served by get_stats (see paxos_stats.py)
+stats = Stats()
 
-#File write
-def _write_file(value):
-    """Write the chosen value into this node's local replica."""
-    with open(FILE_NAME, "w") as f:
-        f.write(str(value))
 
-
-def get_value():
-    """Return the current value stored in this node's replica."""
-    global accepted_value
-    if accepted_value is not None:
-        return accepted_value
-    try:
-        with open(FILE_NAME, "r") as f:
-            data = f.read()
-            return data if data != "" else None
-    except FileNotFoundError:
-        return None
+def _make_durable(wal, lsn):
+    """Wait until record lsn of wal is on disk."""
+    with stats.timer("wal.wait"):
+        wal.wait(lsn)
 
 
-def _next_proposal_number():
-    """
-    Generate a unique proposal number for this node.
-    Simple scheme: (local_counter * 10) + NODE_ID
-    so different nodes don't collide.
-    """
-    global proposal_counter
-    proposal_counter += 1
-    return proposal_counter * 10 + NODE_ID
+def _backoff(attempt):
+    """Randomized exponential backoff after a rejected proposal."""
+    time.sleep(random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt)))
 
 
 def _get_peer_addresses():
-    """Return addresses of the other two nodes."""
+    """Return the addresses of every node in ALL_NODES except this one."""
     return [addr for i, addr in enumerate(ALL_NODES) if i != NODE_INDEX]
 
 
-def _call_remote(addr, func_name, *args, **kwargs):
+# Peer connection pool
+# Server-to-server RPCs reuse long-lived authenticated connections, so the
+# TCP handshake and authkey challenge are paid once per connection rather
+# than once per prepare/accept.
+
+def _connect(addr):
     """
-    Very small, direct RPC client for server-to-server calls,
-    using the same pickle protocol as client.py.
+    Open an authenticated connection to a peer, the same way
+    multiprocessing's Client() does but with a connect timeout.
     """
-    c = Client(addr, authkey=AUTHKEY)
+    s = socket.create_connection(addr, timeout=CONNECT_TIMEOUT)
+    s.settimeout(None)
+    c = Connection(s.detach())
     try:
-        # Send (func_name, args, kwargs) as a pickled bytes object
-        c.send(pickle.dumps((func_name, args, kwargs)))
-        # Receive pickled result
-        result = pickle.loads(c.recv())
-        if isinstance(result, Exception):
-            raise result
-        return result
-    finally:
+        answer_challenge(c, AUTHKEY)
+        deliver_challenge(c, AUTHKEY)
+    except Exception:
         c.close()
+        raise
+    return c
+
+
+class _StaleConnection(Exception):
+    """A request that is safe to send again on a new connection; cause is the original error."""
+    def __init__(self, cause):
+        super().__init__(cause)
+        self.cause = cause
+
+
+class PeerConnection:
+    """One long-lived connection to a peer, used by one caller at a time."""
+    def __init__(self, addr):
+        self.addr = addr
+        self.lock = Lock()
+        self._conn = None
+        self._call_id = 0
+        self.last_used = time.monotonic()
+
+    def close(self):
+        if self._conn is not None:
+            try:
+                self._conn.close()
+            except OSError:
+                pass
+            self._conn = None
+
+    def _roundtrip(self, func_name, args, kwargs, timeout):
+        """
+        Send one request and return the raw reply frame. Raises _StaleConnection
+        if sending fails, so the peer never got the request, or if the peer
+        closes the connection before replying to an IDEMPOTENT_FUNCTIONS call.
+        Any other request may have run on the peer before it went away, so
+        those errors are raised as they are.
+        """
+        self._call_id = (self._call_id + 1) & 0xFFFFFFFF
+        try:
+            self._conn.send_bytes(encode_request(self._call_id, func_name, args, kwargs))
+        except (EOFError, OSError) as e:
+            raise _StaleConnection(e) from e
+        if not self._conn.poll(timeout):
+            raise TimeoutError(f"{func_name} to {self.addr} timed out")
+        try:
+            frame = self._conn.recv_bytes()
+        except EOFError as e:
+            if func_name not in IDEMPOTENT_FUNCTIONS:
+                raise
+            raise _StaleConnection(e) from e
+        if len(frame) < HEADER.size or HEADER.unpack_from(frame)[0] != self._call_id:
+            raise CodecError(f"unexpected reply from {self.addr}")
+        return frame
+
+    def call(self, func_name, args, kwargs, timeout=RPC_TIMEOUT):
+        with self.lock:
+            # An idle connection should have nothing to read; if it does,
+            # the peer closed it (e.g. it restarted) and we reconnect
+            if self._conn is not None and self._conn.poll(0):
+                self.close()
+            reused = self._conn is not None
+            if self._conn is None:
+                self._conn = _connect(self.addr)
+            try:
+                try:
+                    frame = self._roundtrip(func_name, args, kwargs, timeout)
+                except _StaleConnection as e:
+                    # A reused connection may have gone stale; retry once on a fresh one
+                    self.close()
+                    if not reused:
+                        raise e.cause
+                    self._conn = _connect(self.addr)
+                    try:
+                        frame = self._roundtrip(func_name, args, kwargs, timeout)
+                    except _StaleConnection as e:
+                        raise e.cause
+            except Exception:
+                # Never resent: after a timeout the peer may still run the
+                # request, and its late reply would be read by the next
+                # caller, so this connection is dropped
+                self.close()
+                raise
+            self.last_used = time.monotonic()
+        # Raises the peer's exception, if the call failed there
+        return decode_reply(frame)[1]
 
-# Paxos RPCs: prepare & accept
 
-def prepare(n):
+class PeerPool:
     """
-    Paxos Phase 1: prepare(n)
-    Returns:
-      ("promise", accepted_n, accepted_value) on success
-      ("reject", promised_n) on failure
+    Up to POOL_SIZE connections to one peer, handed out to callers.
+    Each peer also gets its own worker threads for parallel fan-out, so a
+    slow peer only backs up its own queue.
     """
-    global promised_n, accepted_n, accepted_value
+    def __init__(self, addr, size=POOL_SIZE):
+        self.addr = addr
+        self._slots = Semaphore(size)
+        self._lock = Lock()
+        self._idle = []
+        self._executor = ThreadPoolExecutor(max_workers=size, thread_name_prefix=f"paxos-peer-{addr[0]}")
+        self.rtt = None          # moving average of round-trip time (seconds), None until measured
+        self.failures = 0        # consecutive failed calls; changed under _lock
 
-    if promised_n is None or n > promised_n:
-        print(f"[Node {NODE_ID}] PREPARE: Promised proposal n={n} "
-              f"(prev promised_n={promised_n}, accepted_n={accepted_n}, value={accepted_value})")
-        promised_n = n
-        return ("promise", accepted_n, accepted_value)
-    else:
-        print(f"[Node {NODE_ID}] PREPARE: Rejected proposal n={n} "
-              f"(already promised_n={promised_n})")
-        return ("reject", promised_n)
+    def submit(self, func_name, *args, timeout=RPC_TIMEOUT):
+        """Run func_name(*args) on this peer in the background; returns a Future."""
+        return self._executor.submit(self.call, func_name, args, {}, timeout)
+
+    def call(self, func_name, args, kwargs, timeout=RPC_TIMEOUT):
+        # A peer that is too slow to free up a connection counts as a timeout
+        if not self._slots.acquire(timeout=RPC_TIMEOUT):
+            raise TimeoutError(f"no free connection to {self.addr}")
+        try:
+            with self._lock:
+                pc = self._idle.pop() if self._idle else PeerConnection(self.addr)
+            start = time.perf_counter()
+            try:
+                result = pc.call(func_name, args, kwargs, timeout)
+            except Exception:
+                with self._lock:
+                    self.failures += 1
+                raise
+            finally:
+                with self._lock:
+                    self._idle.append(pc)
+            if func_name not in UNTIMED_FUNCTIONS:
+                self._observe_rtt(time.perf_counter() - start)
+            return result
+        finally:
+            self._slots.release()
+
+    def _observe_rtt(self, sample):
+        with self._lock:
+            self.rtt = sample if self.rtt is None else (1 - RTT_ALPHA) * self.rtt + RTT_ALPHA * sample
+            self.failures = 0
+
+    def rank(self):
+        """Sort key for thrifty mode: healthy peers first, then the lowest RTT."""
+        return (self.failures > 0, self.rtt or 0.0)
 
+    def health_check(self):
+        """Ping idle connections that have not been used recently; drop dead ones."""
+        with self._lock:
+            idle = list(self._idle)
+        for pc in idle:
+            if time.monotonic() - pc.last_used < HEALTH_CHECK_INTERVAL or pc._conn is None:
+                continue
+            # Skip connections that are currently busy
+            if not pc.lock.acquire(blocking=False):
+                continue
+            pc.lock.release()
+            start = time.perf_counter()
+            try:
+                pc.call("ping", (), {})
+            except Exception:
+                pc.close()
+            else:
+                self._observe_rtt(time.perf_counter() - start)
+        # A peer that failed has no live connections to ping; try a fresh one
+        # so thrifty mode notices when it comes back
+        if self.failures and all(pc._conn is None for pc in idle):
+            try:
+                self.call("ping", (), {})
+            except Exception:
+                pass
 
-def accept(n, v):
+
+peer_pools = {}          # addr -> PeerPool
+peer_pools_lock = Lock()
+
+
+# Calls that are harmless for a peer to run twice, so they can be
+# resent after a connection breaks mid-call. Forwarded writes (propose, put,
+# delete, SubmitValue) are not among them.
+IDEMPOTENT_FUNCTIONS = ("prepare", "accept", "decide", "renew_lease", "ping", "get_snapshot",
+                        "get_decided", "get_leader", "get_stats", "get_value", "get")
+
+# Calls left out of the RTT average: client requests forwarded to the leader
+# wait for a whole commit, and catch-up calls move bulk data
+UNTIMED_FUNCTIONS = ("SubmitValue", "get_value", "propose", "put", "get", "delete",
+                     "get_snapshot", "get_decided")
+
+
+def _get_pool(addr):
+    with peer_pools_lock:
+        pool = peer_pools.get(addr)
+        if pool is None:
+            pool = peer_pools[addr] = PeerPool(addr)
+        return pool
+
+
+def _health_check_loop():
+    while True:
+        time.sleep(HEALTH_CHECK_INTERVAL)
+        with peer_pools_lock:
+            pools = list(peer_pools.values())
+        for pool in pools:
+            pool.health_check()
+
+
+def _call_remote(addr, func_name, *args, **kwargs):
     """
-    Paxos Phase 2: accept(n, v)
-    Returns:
-      ("accepted", n) on success
-      ("reject", promised_n) on failure
+    Server-to-server RPC over a pooled connection to addr,
+    using the same wire codec as client.py.
+    Raises TimeoutError if the peer does not answer within RPC_TIMEOUT.
     """
-    global promised_n, accepted_n, accepted_value
-
-    if promised_n is None or n >= promised_n:
-        promised_n = n
-        accepted_n = n
-        accepted_value = v
-        _write_file(v)
-        print(f"[Node {NODE_ID}] ACCEPT: Accepted proposal n={n} with value={v}")
-        return ("accepted", n)
+    return _get_pool(addr).call(func_name, args, kwargs)
+
+
+def _forward(addr, func_name, *args):
+    """Like _call_remote, but waits up to FORWARD_TIMEOUT for a full client request."""
+    return _get_pool(addr).call(func_name, args, {}, FORWARD_TIMEOUT)
+
+
+def ping():
+    """Health check used by peers to keep pooled connections alive."""
+    return True
+
+
+def _quorum_call(quorum, local, ok, func_name, *args):
+    """
+    Send func_name(*args) to the peers at the same time.
+    local() gives this node's own answer; it runs once the peers' requests
+    are on their way, so its WAL fsync overlaps the round trip. Returns the
+    responses collected as soon as quorum of them start with ok, as soon as
+    quorum can no longer be reached, or when RPC_TIMEOUT runs out. Peers
+    that answer later are left to finish on their peer's workers; their
+    replies are dropped.
+
+    Normally every peer is asked. In THRIFTY mode only the fastest peers
+    needed for a quorum are; another peer is added for each one that fails
+    or rejects, and all remaining peers once the first ones are overdue.
+    """
+    responses = []
+    pending = set()
+    if THRIFTY:
+        spare = sorted(_get_peer_addresses(), key=lambda addr: _get_pool(addr).rank())
     else:
-        print(f"[Node {NODE_ID}] ACCEPT: Rejected proposal n={n} "
-              f"(already promised_n={promised_n})")
-        return ("reject", promised_n)
+        spare = _get_peer_addresses()
+    deadline = time.monotonic() + RPC_TIMEOUT
+    fallback_at = 0.0
 
+    def send(count):
+        # fallback_at: when the slowest peer asked so far is overdue
+        nonlocal fallback_at
+        now = time.monotonic()
+        for addr in spare[:count]:
+            pool = _get_pool(addr)
+            pending.add(pool.submit(func_name, *args))
+            rtt = pool.rtt if pool.rtt is not None else RPC_TIMEOUT / THRIFTY_RTT_FACTOR
+            fallback_at = max(fallback_at, now + max(THRIFTY_MIN_WAIT, THRIFTY_RTT_FACTOR * rtt))
+        fallback_at = min(fallback_at, deadline)
+        stats.incr("messages." + func_name, len(spare[:count]))
+        del spare[:count]
 
-# Client-facing RPC: SubmitValue 
+    # Thrifty: count on our own answer being ok; if it is not, the loop asks another peer
+    send(quorum - 1 if THRIFTY else len(spare))
+    responses.append(local())
+    while True:
+        oks = sum(1 for resp in responses if resp[0] == ok)
+        if oks >= quorum:
+            break
+        # A peer failed or said no: bring in the next fastest one
+        missing = quorum - oks - len(pending)
+        if missing > 0 and spare:
+            stats.incr("thrifty_fallbacks")
+            send(missing)
+        if not pending or oks + len(pending) < quorum:
+            break
+        now = time.monotonic()
+        if now >= deadline:
+            break
+        if spare and now >= fallback_at:
+            # The chosen peers are overdue; ask everyone left
+            stats.incr("thrifty_fallbacks")
+            send(len(spare))
+        done, still_pending = wait(pending, timeout=(fallback_at if spare else deadline) - now,
+                                   return_when=FIRST_COMPLETED)
+        pending.intersection_update(still_pending)
+        for f in done:
+            try:
+                responses.append(f.result())
+            except TimeoutError:
+                stats.incr("rpc_timeouts")
+            except Exception:
+                # Treat RPC failure or timeout as no response
+                stats.incr("rpc_failures")
+    if sum(1 for resp in responses if resp[0] == ok) < quorum and pending:
+        stats.incr("quorum_timeouts")
+    return responses
 
-def SubmitValue(value):
+def _node_of(n):
+    """Address of the node that generated proposal number n."""
+    return ALL_NODES[n % PROPOSAL_STRIDE - 1]
+
+
+class Batcher:
     """
-    Client entry point.
-    This node acts as a proposer and runs Basic Paxos
-    to choose a value for the replicated file.
+    Groups concurrent SubmitValue calls into one proposal (at most max_size
+    values, waiting at most linger seconds for more) and keeps up to window
+    proposals in flight. When the window is full no new batch is formed,
+    so values queue up and go out together once a slot frees up.
     """
+    def __init__(self, propose, max_size=BATCH_MAX_SIZE, linger=BATCH_LINGER, window=PIPELINE_WINDOW):
+        self._propose = propose
+        self._max_size = max_size
+        self._linger = linger
+        self._cond = Condition()
+        self._pending = []       # (value, Future) in arrival order
+        self._thread = None
+        self._window = BoundedSemaphore(window)
+        self._in_flight = 0      # guarded by _cond, like _pending
+        self._workers = ThreadPoolExecutor(max_workers=window, thread_name_prefix="paxos-pipeline")
 
-    # Random delay to help simulate races between two proposers
-    # when you run two clients in parallel.
-    time.sleep(random.uniform(0, 2))
+    def submit(self, value):
+        """Queue value and block until its batch has been decided (or failed)."""
+        fut = Future()
+        with self._cond:
+            if self._thread is None:
+                self._thread = Thread(target=self._run, daemon=True)
+                self._thread.start()
+            self._pending.append((value, fut))
+            self._cond.notify()
+        return fut.result()
 
-    n = _next_proposal_number()
+    def _next_batch(self):
+        with self._cond:
+            while not self._pending:
+                self._cond.wait()
+            deadline = time.monotonic() + self._linger
+            while len(self._pending) < self._max_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            batch = self._pending[:self._max_size]
+            del self._pending[:self._max_size]
+            return batch
 
-    # Phase 1: Prepare
-    promises = []
-    highest_accepted_n = None
-    highest_accepted_val = None
+    def _run(self):
+        while True:
+            # Backpressure: wait for a free pipeline slot before taking a batch
+            self._window.acquire()
+            batch = self._next_batch()
+            with self._cond:
+                self._in_flight += 1
+            self._workers.submit(self._commit, batch)
 
-    # First, talk to self directly
-    responses = []
-    responses.append(prepare(n))
+    def _commit(self, batch):
+        try:
+            results = self._propose([value for value, _ in batch])
+        except Exception as e:
+            for _, fut in batch:
+                fut.set_exception(e)
+        else:
+            for (_, fut), result in zip(batch, results):
+                fut.set_result(result)
+        finally:
+            with self._cond:
+                self._in_flight -= 1
+            self._window.release()
+
+    def pending(self):
+        """Values waiting for a batch."""
+        return len(self._pending)
+
+    def in_flight(self):
+        """Batches proposed but not yet decided."""
+        with self._cond:
+            return self._in_flight
 
-    # Then talk to other nodes via RPC
-    for addr in _get_peer_addresses():
+
+# State machines
+# The chosen log entries of a group are applied to one of these. Every log
+# entry is a batch: a list of client values applied in order.
+
+class RegisterMachine:
+    """The original replicated file: each value overwrites the previous one."""
+    def __init__(self, path):
+        self.path = path
+        self.value = None
+        if not os.path.exists(path):
+            with open(path, "w") as f:
+                f.write("")
+
+    def _write_file(self, value):
+        """Write the chosen value into this node's local replica."""
+        with open(self.path, "w") as f:
+            f.write(str(value))
+
+    def apply(self, batch):
+        if batch:
+            self.value = batch[-1]
+            self._write_file(self.value)
+
+    def state(self):
+        return self.value
+
+    def restore(self, state):
+        self.value = state
+        if state is not None:
+            self._write_file(state)
+
+    def read(self):
+        """Return the current value stored in this node's replica."""
+        if self.value is not None:
+            return self.value
         try:
-            resp = _call_remote(addr, "prepare", n)
-            responses.append(resp)
-        except Exception:
-            # Treat RPC failure as no response
-            pass
+            with open(self.path, "r") as f:
+                data = f.read()
+                return data if data != "" else None
+        except FileNotFoundError:
+            return None
 
-    for resp in responses:
-        if resp[0] == "promise":
-            _, acc_n, acc_val = resp
-            promises.append(resp)
-            if acc_n is not None and (highest_accepted_n is None or acc_n > highest_accepted_n):
-                highest_accepted_n = acc_n
-                highest_accepted_val = acc_val
 
-    if len(promises) < MAJORITY:
-        return f"Proposal Num: {proposal_counter}, SubmitValue FAILED in Phase 1 (only {len(promises)} promises)."
+class KVMachine:
+    """One shard of the key-value store. Entries are ("put", key, value) or ("delete", key)."""
+    def __init__(self):
+        self.data = {}
 
-    # If any acceptor has already accepted a value, we must propose that value
-    if highest_accepted_val is not None:
-        v_to_propose = highest_accepted_val
-    else:
-        v_to_propose = value
+    def apply(self, batch):
+        for op in batch:
+            if op[0] == "put":
+                self.data[op[1]] = op[2]
+            elif op[0] == "delete":
+                self.data.pop(op[1], None)
+
+    def state(self):
+        return self.data
+
+    def restore(self, state):
+        self.data = dict(state or {})
+
+    def read(self, key):
+        return self.data.get(key)
+
+
+# Paxos groups
+# Each group is an independent Multi-Paxos log with its own acceptor state,
+# WAL, snapshot, leader and lease, so groups commit in parallel. Group 0
+# replicates the original file (SubmitValue/get_value); groups 1..KV_SHARDS
+# each hold one hash partition of the key-value store (put/get/delete).
+
+class PaxosGroup:
+    def __init__(self, gid, machine, wal_file, snapshot_file, preferred_leader=None):
+        """
+        preferred_leader is the index in ALL_NODES of the node that should
+        lead this group while it is up, so leadership of the shards is
+        spread over the cluster; None lets whichever node is asked first lead.
+        """
+        self.gid = gid
+        self.machine = machine
+        self.wal_file = wal_file
+        self.snapshot_file = snapshot_file
+        self.preferred_leader = preferred_leader
 
-    # Phase 2: Accept
-    accepts = 0
+        # Acceptor state
+        # One promise covers every slot of the replicated log, so once a leader has
+        # finished Phase 1 it can commit each new slot with a single accept round.
+        self.promised_n = None        # highest proposal number promised (all slots)
+        self.accepted_n = None        # highest proposal number accepted (any slot)
+        self.accepted_value = None    # value associated with accepted_n
+        self.accepted_log = AcceptorLog()   # slot -> (accepted_n, accepted_value), see paxos_store.py
 
-    # Self
-    resp = accept(n, v_to_propose)
-    if resp[0] == "accepted":
-        accepts += 1
+        # Learner state
+        self.chosen_log = {}          # slot -> chosen batch, waiting to be applied in order
+        self.applied_slot = -1        # last slot applied to the state machine
+        self.snapshot_slot = -1       # last slot covered by the snapshot; older log entries are dropped
+        self.decided_log = AcceptorLog()  # slot -> chosen batch for every applied slot after snapshot_slot
+        self.last_catch_up = 0.0      # when this node last asked peers for missing slots
+        self.max_decided = -1         # highest slot this node has been told is chosen
+        self.caught_up_at = None      # last time every slot up to max_decided was applied here
 
-    # Others
-    for addr in _get_peer_addresses():
+        # Leases (acceptor side): after accepting from a leader, an acceptor refuses
+        # to promise any other node's proposal number for LEASE_DURATION
+        self.granted_lease_n = None   # proposal number the lease was granted to
+        self.granted_lease_expiry = 0.0
+
+        # Leader state (used when this node acts as proposer)
+        self.leader_n = None          # proposal number Phase 1 succeeded with, None if not leader
+        self.next_slot = 0            # next free slot this leader will propose into
+        self.lease_n = None           # proposal number our current lease was granted for
+        self.lease_until = 0.0        # time.monotonic() at which our lease runs out
+        self.lease_renewing = False   # a background renewal is in flight
+        self.highest_rejecting_n = None   # highest promised_n an acceptor has rejected us with
+        self.proposal_counter = 0     # local proposal counter (see _next_proposal_number)
+
+        # Durable acceptor state: every promise and accept is appended to the WAL
+        # and fsynced (shared with concurrent calls) before the reply goes out
+        self.wal = None
+
+        # Acceptor/learner state is touched by every connection thread
+        self.state_lock = RLock()
+        # Guards leader_n/next_slot; held for all of Phase 1, but only while
+        # picking a slot for Phase 2 so that several slots can be in flight
+        self.proposer_lock = RLock()
+        # Only one catch-up at a time
+        self.catch_up_lock = Lock()
+        # Signalled whenever applied_slot moves forward
+        self.applied_cond = Condition(self.state_lock)
+
+        self.batcher = Batcher(self._propose_batch)
+
+    def _tag(self):
+        return f"[Node {NODE_ID}]" if self.gid == 0 else f"[Node {NODE_ID} g{self.gid}]"
+
+    # Durability: WAL and snapshots
+
+    def recover(self):
+        """
+        Load the latest snapshot, replay the acceptor WAL on top of it, then
+        open the WAL for appending. Must run before the node starts serving
+        RPCs. Only entries newer than the snapshot are replayed, so startup
+        time depends on the snapshot size rather than on the log's history.
+        """
+        snapshot, _ = read_records(self.snapshot_file)
+        if snapshot:
+            _, self.snapshot_slot, state = snapshot[0]
+            self.applied_slot = self.snapshot_slot
+            self.machine.restore(state)
+
+        records, _ = read_records(self.wal_file)
+        for record in records:
+            if record[0] == "promise":
+                _, n = record
+            else:
+                _, n, slot, v = record
+                self.accepted_log[slot] = (n, v)
+                if self.accepted_n is None or n >= self.accepted_n:
+                    self.accepted_n, self.accepted_value = n, v
+            if self.promised_n is None or n > self.promised_n:
+                self.promised_n = n
+        # Never reuse a proposal number from before the restart
+        if self.promised_n is not None:
+            self.proposal_counter = max(self.proposal_counter, self.promised_n // PROPOSAL_STRIDE)
+            # Leases are not logged, and we may have granted one just before
+            # going down that its holder is still serving reads under. Back
+            # the highest proposal number we know for a full lease period.
+            self._grant_lease(self.promised_n)
+        self.wal = WriteAheadLog(self.wal_file)
+        if self.gid == 0 or snapshot or records:
+            print(f"{self._tag()} RECOVER: snapshot at slot {self.snapshot_slot}, replayed {len(records)} "
+                  f"WAL records (promised_n={self.promised_n}, {len(self.accepted_log)} accepted slots)")
+
+    def _wal_records(self):
+        """The acceptor's whole durable state as WAL records (used for compaction)."""
+        records = []
+        if self.promised_n is not None:
+            records.append(("promise", self.promised_n))
+        for slot, (n, v) in self.accepted_log.items():
+            records.append(("accept", n, slot, v))
+        return records
+
+    def _take_snapshot(self):
+        """
+        Save the applied state as of applied_slot, then drop every log entry it
+        covers from memory and from the WAL. Called with state_lock held.
+        """
+        write_atomic(self.snapshot_file, [("snapshot", self.applied_slot, self.machine.state())])
+        self.snapshot_slot = self.applied_slot
+        self.accepted_log.evict_through(self.snapshot_slot)
+        self.decided_log.evict_through(self.snapshot_slot)
+        self.wal.compact(self._wal_records())
+        print(f"{self._tag()} SNAPSHOT: state saved at slot {self.snapshot_slot}, log compacted")
+
+    def get_snapshot(self):
+        """Return this group's snapshot file as raw bytes (b"" if there is none yet)."""
         try:
-            resp = _call_remote(addr, "accept", n, v_to_propose)
-            if resp[0] == "accepted":
-                accepts += 1
-        except Exception:
-            pass
+            with open(self.snapshot_file, "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return b""
 
-    if accepts >= MAJORITY:
-        return f"Proposal Num: {proposal_counter}, SubmitValue SUCCEEDED. Chosen value = {v_to_propose}"
-    else:
-        return f"Proposal Num: {proposal_counter}, SubmitValue FAILED in Phase 2 (only {accepts} accepts)."
+    def _install_snapshot(self, data):
+        """Jump ahead to a peer's snapshot if it covers slots we have not applied."""
+        records, _ = decode_records(data)
+        if not records:
+            return False
+        _, slot, state = records[0]
+        with self.state_lock:
+            if slot <= self.applied_slot:
+                return False
+            self.applied_slot = slot
+            self.machine.restore(state)
+            for s in [s for s in self.chosen_log if s <= slot]:
+                del self.chosen_log[s]
+            print(f"{self._tag()} SNAPSHOT: installed peer snapshot at slot {slot}")
+            self._take_snapshot()
+            self._apply_chosen()
+        return True
+
+    def get_decided(self, first_slot, limit=CATCH_UP_BATCH):
+        """
+        Chosen batches for a lagging peer: up to limit slots from first_slot on.
+        Returns (snapshot_slot, [(slot, batch), ...]). The list is empty if
+        first_slot is already compacted into the snapshot (the peer must
+        install the snapshot first) or if this node has not applied it yet.
+        """
+        with self.state_lock:
+            if first_slot <= self.snapshot_slot:
+                return self.snapshot_slot, []
+            last = min(self.applied_slot, first_slot + limit - 1)
+            return self.snapshot_slot, [(slot, self.decided_log[slot][1]) for slot in range(first_slot, last + 1)]
+
+    def _catch_up(self):
+        """
+        Bring this replica up to date from its peers, fastest first: install a
+        peer's snapshot if that peer has compacted past our applied_slot, then
+        stream the chosen batches after it. Snapshots taken while applying
+        (every SNAPSHOT_INTERVAL slots) checkpoint progress, so an interrupted
+        catch-up resumes from the last one.
+        """
+        if not self.catch_up_lock.acquire(blocking=False):
+            return
+        try:
+            self.last_catch_up = time.monotonic()
+            for addr in sorted(_get_peer_addresses(), key=lambda addr: _get_pool(addr).rank()):
+                try:
+                    self._stream_decided(addr)
+                except Exception:
+                    pass
+                if self.applied_slot >= self.max_decided:
+                    break
+        finally:
+            self.catch_up_lock.release()
+
+    def _stream_decided(self, addr):
+        """Apply every chosen slot addr has that we lack, CATCH_UP_BATCH slots per request."""
+        pool = _get_pool(addr)
+        fetched = self.applied_slot
+        pending = pool.submit("get_decided", self.gid, fetched + 1, timeout=FORWARD_TIMEOUT)
+        while True:
+            snapshot_slot, entries = pending.result()
+            if not entries:
+                if snapshot_slot <= self.applied_slot:
+                    return
+                # The peer compacted past us: jump to its snapshot, then continue after it
+                data = pool.call("get_snapshot", (self.gid,), {}, FORWARD_TIMEOUT)
+                if not self._install_snapshot(data):
+                    return
+                fetched = self.applied_slot
+                pending = pool.submit("get_decided", self.gid, fetched + 1, timeout=FORWARD_TIMEOUT)
+                continue
+            # Ask for the next batch before applying this one
+            fetched = entries[-1][0]
+            pending = pool.submit("get_decided", self.gid, fetched + 1, timeout=FORWARD_TIMEOUT)
+            with self.state_lock:
+                for slot, batch in entries:
+                    if slot > self.applied_slot:
+                        self.chosen_log[slot] = batch
+                self.max_decided = max(self.max_decided, fetched)
+                self._apply_chosen()
+                if self.applied_slot >= self.max_decided:
+                    self.caught_up_at = time.monotonic()
+            stats.incr("catch_up_slots", len(entries))
+
+    # Reads
+
+    def read(self, local_read, forward, max_staleness=None, forwarded=False):
+        """
+        Run local_read() against this group's state machine.
+        By default the read is linearizable: the leader answers from memory
+        while it holds a lease, and any other node hands the read to the
+        leader with forward(addr). With max_staleness (seconds), a follower
+        that had applied everything the leader told it at most that long
+        ago answers from its own replica.
+        """
+        if max_staleness is not None and self.caught_up_at is not None \
+                and time.monotonic() - self.caught_up_at <= max_staleness:
+            return local_read()
+
+        if self._ensure_lease():
+            return self._read_under_lease(local_read)
+
+        leader = self._known_leader()
+        if leader is not None and leader != ALL_NODES[NODE_INDEX] and not forwarded:
+            try:
+                return forward(leader)
+            except Exception:
+                pass
+
+        # No reachable leader: take over (one full Paxos round), then read under
+        # our own lease. Another node may be doing the same, so back off between tries
+        for attempt in range(MAX_ATTEMPTS):
+            if attempt:
+                _backoff(attempt)
+                leader = self._leader_hint()
+                if leader is not None and leader != ALL_NODES[NODE_INDEX] and not forwarded:
+                    try:
+                        return forward(leader)
+                    except (OSError, EOFError):
+                        # Leader unreachable; take over once its lease runs out
+                        self._wait_out_lease()
+            with self.proposer_lock:
+                if self.leader_n is None:
+                    self._become_leader()
+            if self._ensure_lease():
+                return self._read_under_lease(local_read)
+        raise RuntimeError("no leader holds a lease; try again")
+
+    def _read_under_lease(self, local_read):
+        """Wait until every slot this leader knows is chosen has been applied."""
+        with self.applied_cond:
+            if not self.applied_cond.wait_for(lambda: self.applied_slot >= self.max_decided,
+                                              timeout=RPC_TIMEOUT):
+                raise TimeoutError("earlier slots are still being decided")
+            return local_read()
+
+    # Proposal numbers
+
+    def _next_proposal_number(self):
+        """
+        Generate a unique proposal number for this node.
+        Simple scheme: (local_counter * PROPOSAL_STRIDE) + NODE_ID
+        so different nodes don't collide.
+        """
+        self.proposal_counter += 1
+        return self.proposal_counter * PROPOSAL_STRIDE + NODE_ID
+
+    def _observe_rejects(self, responses):
+        """
+        Move proposal_counter past every promised_n carried by a reject, so our
+        next proposal number beats it. Returns True if any response was a reject.
+        """
+        rejected = [resp[1] for resp in responses if resp[0] == "reject" and resp[1] is not None]
+        if rejected:
+            with self.proposer_lock:
+                self.proposal_counter = max(self.proposal_counter, max(rejected) // PROPOSAL_STRIDE)
+                self.highest_rejecting_n = max(self.highest_rejecting_n or 0, max(rejected))
+        return any(resp[0] == "reject" for resp in responses)
+
+    # Paxos RPCs: prepare, accept & decide
+
+    def prepare(self, n, first_slot=0):
+        """
+        Paxos Phase 1: prepare(n) for every slot >= first_slot
+        Returns:
+          ("promise", {slot: (accepted_n, accepted_value)}, snapshot_slot) on success
+          ("reject", promised_n) on failure
+        Slots up to snapshot_slot have been compacted away on this acceptor.
+        """
+        with self.state_lock:
+            if self._lease_blocks(n):
+                stats.incr("prepare_rejects")
+                if stats.tracing:
+                    print(f"{self._tag()} PREPARE: Rejected proposal n={n} "
+                          f"(lease held by n={self.granted_lease_n})")
+                return ("reject", self.promised_n)
+            if self.promised_n is None or n > self.promised_n:
+                stats.incr("promises")
+                if stats.tracing:
+                    print(f"{self._tag()} PREPARE: Promised proposal n={n} from slot {first_slot} "
+                          f"(prev promised_n={self.promised_n}, accepted_n={self.accepted_n}, "
+                          f"value={self.accepted_value})")
+                self.promised_n = n
+                accepted = dict(self.accepted_log.items(first_slot))
+                compacted_to = self.snapshot_slot
+                lsn = self.wal.append(("promise", n))
+            else:
+                stats.incr("prepare_rejects")
+                if stats.tracing:
+                    print(f"{self._tag()} PREPARE: Rejected proposal n={n} "
+                          f"(already promised_n={self.promised_n})")
+                return ("reject", self.promised_n)
+        # The promise only counts once it survives a restart
+        _make_durable(self.wal, lsn)
+        return ("promise", accepted, compacted_to)
+
+    def accept(self, n, v, slot=0):
+        """
+        Paxos Phase 2: accept(n, v) for one log slot
+        Returns:
+          ("accepted", n) on success
+          ("reject", promised_n) on failure
+        """
+        with self.state_lock:
+            if self.promised_n is None or n >= self.promised_n:
+                self.promised_n = n
+                self.accepted_n = n
+                self.accepted_value = v
+                self.accepted_log[slot] = (n, v)
+                self._grant_lease(n)
+                lsn = self.wal.append(("accept", n, slot, v))
+                stats.incr("accepts")
+                if stats.tracing:
+                    print(f"{self._tag()} ACCEPT: Accepted proposal n={n} for slot {slot} with value={v}")
+            else:
+                stats.incr("accept_rejects")
+                if stats.tracing:
+                    print(f"{self._tag()} ACCEPT: Rejected proposal n={n} for slot {slot} "
+                          f"(already promised_n={self.promised_n})")
+                return ("reject", self.promised_n)
+        _make_durable(self.wal, lsn)
+        return ("accepted", n)
+
+    def renew_lease(self, n):
+        """
+        Lease request from the leader with proposal number n, sent when it has
+        not extended its lease through an accept round recently.
+        Returns:
+          ("granted", n) on success
+          ("reject", promised_n) on failure
+        """
+        lsn = None
+        with self.state_lock:
+            if self._lease_blocks(n) or (self.promised_n is not None and n < self.promised_n):
+                return ("reject", self.promised_n)
+            if self.promised_n is None or n > self.promised_n:
+                self.promised_n = n
+                lsn = self.wal.append(("promise", n))
+            self._grant_lease(n)
+        if lsn is not None:
+            _make_durable(self.wal, lsn)
+        return ("granted", n)
+
+    def _grant_lease(self, n):
+        """Back proposal number n for LEASE_DURATION. Called with state_lock held."""
+        self.granted_lease_n = n
+        self.granted_lease_expiry = time.monotonic() + LEASE_DURATION
+
+    def _lease_blocks(self, n):
+        """
+        True while a lease granted to another node is running. The lease holder
+        itself may move to a higher proposal number (e.g. after a reject).
+        """
+        return (self.granted_lease_n is not None
+                and self.granted_lease_n % PROPOSAL_STRIDE != n % PROPOSAL_STRIDE
+                and time.monotonic() < self.granted_lease_expiry)
+
+    def _wait_out_lease(self):
+        """
+        Sleep until the lease this acceptor granted runs out. Used once the
+        holder turned out to be unreachable: until then the acceptors reject
+        every other node's prepare, so taking over cannot succeed earlier.
+        """
+        with self.state_lock:
+            remaining = self.granted_lease_expiry - time.monotonic()
+        if remaining > 0:
+            time.sleep(min(remaining, LEASE_DURATION))
+
+    def _lease_holder(self):
+        """Address of the leader this node currently backs with a lease, or None."""
+        with self.state_lock:
+            if self.granted_lease_n is None or time.monotonic() >= self.granted_lease_expiry:
+                return None
+            return _node_of(self.granted_lease_n)
+
+    def _leader_hint(self):
+        """
+        The node to hand requests to after one of our proposals was rejected:
+        the lease holder, else whoever issued the proposal number that beat us.
+        """
+        leader = self._lease_holder()
+        if leader is None and self.highest_rejecting_n is not None:
+            leader = _node_of(self.highest_rejecting_n)
+        return leader
+
+    def _known_leader(self):
+        """Best guess at the current leader's address, or None."""
+        with self.state_lock:
+            n = self.granted_lease_n if time.monotonic() < self.granted_lease_expiry else self.promised_n
+        return _node_of(n) if n is not None else None
+
+    def decide(self, slot, v):
+        """
+        Learner: the leader tells us slot has been chosen with value v.
+        Chosen values are applied to the replica strictly in slot order.
+        """
+        with self.state_lock:
+            self.max_decided = max(self.max_decided, slot)
+            if slot > self.applied_slot:
+                self.chosen_log[slot] = v
+                self._apply_chosen()
+            if self.applied_slot >= self.max_decided:
+                self.caught_up_at = time.monotonic()
+            # Missing earlier slots; fetch them from a peer
+            lagging = slot > self.applied_slot + 1
+        if lagging and time.monotonic() - self.last_catch_up > CATCH_UP_INTERVAL \
+                and not self.catch_up_lock.locked():
+            Thread(target=self._catch_up, daemon=True).start()
+        return True
+
+    def _apply_chosen(self):
+        """Apply every chosen slot that directly follows applied_slot."""
+        while self.applied_slot + 1 in self.chosen_log:
+            batch = self.chosen_log.pop(self.applied_slot + 1)
+            self.applied_slot += 1
+            # Kept until the next snapshot so lagging peers can fetch it (get_decided)
+            self.decided_log.put(self.applied_slot, 0, batch)
+            self.machine.apply(batch or ())
+            if self.applied_slot - self.snapshot_slot >= SNAPSHOT_INTERVAL:
+                self._take_snapshot()
+        self.applied_cond.notify_all()
+
+    def _broadcast_decide(self, slot, v):
+        """Tell the other nodes about a chosen slot, off the commit path."""
+        for addr in _get_peer_addresses():
+            _get_pool(addr).submit("decide", slot, v, self.gid)
+
+    # Proposer / leader
+
+    def _become_leader(self):
+        """
+        Run Phase 1 once for every slot past what this node has applied.
+        Values accepted in those slots are re-proposed under the new proposal
+        number (gaps are filled with NOOP) before any new value is added.
+        Returns (promises received, whether any acceptor rejected us).
+        """
+        n = self._next_proposal_number()
+        with self.state_lock:
+            first_slot = self.applied_slot + 1
+
+        # Every other node in parallel, and self while they answer
+        stats.incr("elections")
+        with stats.timer("phase.prepare"):
+            responses = _quorum_call(PHASE1_QUORUM, partial(self.prepare, n, first_slot), "promise",
+                                     "prepare", n, first_slot, self.gid)
+
+        rejected = self._observe_rejects(responses)
+        promises = [resp for resp in responses if resp[0] == "promise"]
+        if len(promises) < PHASE1_QUORUM:
+            return len(promises), rejected
+
+        # Acceptors that compacted past first_slot no longer know those slots;
+        # they are all chosen, so take a snapshot that covers them instead
+        if max(compacted_to for _, _, compacted_to in promises) >= first_slot:
+            self._catch_up()
+            with self.state_lock:
+                first_slot = self.applied_slot + 1
+            if max(compacted_to for _, _, compacted_to in promises) >= first_slot:
+                return 0, False
+
+        # For each slot, we must propose the value with the highest accepted_n
+        recovered = {}
+        for _, accepted, _ in promises:
+            for slot, (acc_n, acc_val) in accepted.items():
+                if slot >= first_slot and (slot not in recovered or acc_n > recovered[slot][0]):
+                    recovered[slot] = (acc_n, acc_val)
+
+        self.leader_n = n
+        last_slot = max(recovered, default=first_slot - 1)
+        self.next_slot = last_slot + 1
+        print(f"{self._tag()} LEADER: n={n}, recovering slots {first_slot}..{last_slot}")
+
+        for slot in range(first_slot, last_slot + 1):
+            v = recovered[slot][1] if slot in recovered else NOOP
+            accepts, rejected = self._commit_slot(slot, v, n)
+            if accepts < PHASE2_QUORUM:
+                return 0, rejected
+        return len(promises), False
+
+    def _commit_slot(self, slot, v, n):
+        """
+        Phase 2 for one slot under proposal number n.
+        Returns (number of accepts, whether any acceptor rejected us);
+        on PHASE2_QUORUM accepts the slot is decided.
+        """
+        # Every other node in parallel, and self while they answer
+        start = time.monotonic()
+        with stats.timer("phase.accept"):
+            responses = _quorum_call(PHASE2_QUORUM, partial(self.accept, n, v, slot), "accepted",
+                                     "accept", n, v, slot, self.gid)
+        accepts = sum(1 for resp in responses if resp[0] == "accepted")
+        rejected = self._observe_rejects(responses)
+
+        if accepts >= PHASE2_QUORUM:
+            # Each acceptor started its lease after we sent, so ours is the shorter one
+            self._extend_lease(n, start)
+            self.decide(slot, v)
+            self._broadcast_decide(slot, v)
+        if accepts < PHASE2_QUORUM or rejected:
+            # Someone has promised a higher proposal number; step down (the next
+            # batch runs Phase 1 again with a higher number), unless this was a
+            # straggler from an older term and we are leader again
+            with self.proposer_lock:
+                if self.leader_n == n:
+                    self.leader_n = None
+        return accepts, rejected
+
+    # Leader lease
+    # A Phase 2 quorum of acceptors that accepted from (or renewed) our proposal
+    # number refuse every other node's prepare until their lease runs out. Every
+    # Phase 1 quorum includes one of them, so while our lease is valid no other
+    # node can become leader and reads can be served from this node's memory.
+
+    def _extend_lease(self, n, start):
+        with self.proposer_lock:
+            if self.leader_n != n:
+                return
+            until = start + LEASE_DURATION - LEASE_MARGIN
+            if self.lease_n != n or until > self.lease_until:
+                self.lease_n, self.lease_until = n, until
+
+    def _lease_valid(self):
+        return (self.leader_n is not None and self.lease_n == self.leader_n
+                and time.monotonic() < self.lease_until)
+
+    def _renew_lease(self):
+        """Ask a Phase 2 quorum to (re)grant our lease. Returns True if we hold one."""
+        n = self.leader_n
+        if n is None:
+            return False
+        start = time.monotonic()
+        stats.incr("lease_renewals")
+        with stats.timer("phase.renew_lease"):
+            responses = _quorum_call(PHASE2_QUORUM, partial(self.renew_lease, n), "granted",
+                                     "renew_lease", n, self.gid)
+        if sum(1 for resp in responses if resp[0] == "granted") >= PHASE2_QUORUM:
+            self._extend_lease(n, start)
+            return self._lease_valid()
+        if any(resp[0] == "reject" for resp in responses):
+            with self.proposer_lock:
+                if self.leader_n == n:
+                    self.leader_n = None
+        return False
+
+    def _renew_in_background(self):
+        try:
+            self._renew_lease()
+        finally:
+            self.lease_renewing = False
+
+    def _ensure_lease(self):
+        """
+        True if this node is leader and holds a valid lease, renewing it first
+        if it has lapsed. A lease past its halfway point is renewed in the
+        background so steady reads never wait for a round trip.
+        """
+        if self.leader_n is None:
+            return False
+        if not self._lease_valid():
+            return self._renew_lease()
+        if self.lease_until - time.monotonic() < LEASE_DURATION / 2 and not self.lease_renewing:
+            self.lease_renewing = True
+            Thread(target=self._renew_in_background, daemon=True).start()
+        return True
+
+    # Writes
+
+    def submit(self, value, forwarded=False):
+        """
+        Get value chosen in this group's log; returns (ok, proposal counter, detail).
+        Only one node proposes at a time: if another node currently holds the
+        leader lease (or, with nobody holding one, is this group's preferred
+        leader), the value is forwarded to it. Otherwise this node acts as the
+        leader: Phase 1 only runs when it is not already leader, then the value
+        joins the next batch, which gets the next free slot and is committed
+        with a single accept round.
+        """
+        leader = self.write_target()
+        if leader != ALL_NODES[NODE_INDEX] and not forwarded:
+            stats.incr("forwards")
+            try:
+                return tuple(_forward(leader, "propose", self.gid, value))
+            except (OSError, EOFError, TimeoutError):
+                # Leader unreachable; its lease will run out and we take over
+                pass
+
+        return self.batcher.submit(value)
+
+    def write_target(self):
+        """
+        The node writes for this group should go to: the lease holder, else
+        the preferred leader if it looks up, else this node.
+        """
+        leader = self._lease_holder()
+        if leader is None and self.preferred_leader is not None:
+            leader = ALL_NODES[self.preferred_leader % len(ALL_NODES)]
+            if leader != ALL_NODES[NODE_INDEX] and _get_pool(leader).failures:
+                # Preferred leader looks down; lead the group ourselves
+                leader = None
+        return leader or ALL_NODES[NODE_INDEX]
+
+    def _propose_batch(self, values):
+        """
+        Commit a batch of client values as one log entry.
+        A rejected proposal is retried after a randomized exponential backoff,
+        up to MAX_ATTEMPTS times, or forwarded to the node that won.
+        Returns one (ok, proposal counter, detail) result per value.
+        """
+        stats.incr("batches")
+        stats.incr("values", len(values))
+        results = [None] * len(values)
+        todo = list(range(len(values)))    # indexes of the values not committed or forwarded yet
+        for attempt in range(MAX_ATTEMPTS):
+            if attempt:
+                stats.incr("backoffs")
+                _backoff(attempt)
+                # The node that beat us may hold the lease by now; hand it the values
+                leader = self._leader_hint()
+                if leader is not None and leader != ALL_NODES[NODE_INDEX]:
+                    stats.incr("forwards", len(todo))
+                    pool = _get_pool(leader)
+                    futures = {i: pool.submit("propose", self.gid, values[i], timeout=FORWARD_TIMEOUT)
+                               for i in todo}
+                    unreachable = []
+                    for i, fut in futures.items():
+                        try:
+                            results[i] = tuple(fut.result())
+                        except TimeoutError:
+                            # The leader may still commit it; proposing it again could apply it twice
+                            raise
+                        except (OSError, EOFError):
+                            unreachable.append(i)
+                    if not unreachable:
+                        return results
+                    # Leader unreachable; take over once its lease runs out
+                    todo = unreachable
+                    self._wait_out_lease()
+            ok, rejected, detail = self._try_propose([values[i] for i in todo])
+            if ok or not rejected:
+                break
+        stats.incr("committed_values" if ok else "failed_values", len(todo))
+        for i in todo:
+            results[i] = (ok, self.proposal_counter, detail)
+        return results
+
+    def _try_propose(self, values):
+        """One attempt at _propose_batch. Returns (ok, rejected, detail)."""
+        with self.proposer_lock:
+            if self.leader_n is None:
+                promises, rejected = self._become_leader()
+                if promises < PHASE1_QUORUM:
+                    return False, rejected, f"in Phase 1 (only {promises} promises)"
+
+            n = self.leader_n
+            slot = self.next_slot
+            self.next_slot += 1
+
+        # Phase 2: Accept (other slots may be in flight at the same time)
+        accepts, rejected = self._commit_slot(slot, list(values), n)
+        if accepts >= PHASE2_QUORUM:
+            return True, False, f"slot {slot}"
+        return False, rejected, f"in Phase 2 (only {accepts} accepts)"
+
+
+groups = []              # PaxosGroup per group id, created by _recover_state()
+
+
+def _recover_state():
+    """
+    Create this node's Paxos groups and recover each one from its snapshot
+    and WAL. Must run before the node starts serving RPCs.
+    """
+    global groups
+
+    new_groups = [PaxosGroup(0, RegisterMachine(FILE_NAME), WAL_FILE, SNAPSHOT_FILE)]
+    for i in range(1, KV_SHARDS + 1):
+        base = f"{FILE_NAME}.kv{i}"
+        # Spread the shards' preferred leaders over the nodes
+        new_groups.append(PaxosGroup(i, KVMachine(), base + ".wal", base + ".snap", preferred_leader=i - 1))
+    for group in new_groups:
+        group.recover()
+    groups = new_groups
+
+
+def _group_for_key(key):
+    """The key-value shard that owns key (stable across nodes and restarts)."""
+    if not KV_SHARDS:
+        raise RuntimeError("this node runs no key-value shards (KV_SHARDS = 0)")
+    if not isinstance(key, str):
+        raise TypeError("keys must be strings")
+    return groups[1 + zlib.crc32(key.encode()) % KV_SHARDS]
+
+
+def _group(gid):
+    if not 0 <= gid < len(groups):
+        raise ValueError(f"no Paxos group {gid}")
+    return groups[gid]
+
+
+# Paxos RPCs between nodes; group selects the Paxos instance (0 = the original file)
+
+def prepare(n, first_slot=0, group=0):
+    return _group(group).prepare(n, first_slot)
+
+
+def accept(n, v, slot=0, group=0):
+    return _group(group).accept(n, v, slot)
+
+
+def decide(slot, v, group=0):
+    return _group(group).decide(slot, v)
+
+
+def renew_lease(n, group=0):
+    return _group(group).renew_lease(n)
+
+
+def get_snapshot(group=0):
+    return _group(group).get_snapshot()
+
+
+def get_decided(group, first_slot, limit=CATCH_UP_BATCH):
+    return _group(group).get_decided(first_slot, limit)
+
+
+def propose(group, value):
+    """A value forwarded by another node; this node proposes it itself."""
+    return _group(group).submit(value, forwarded=True)
+
+
+# Client-facing RPCs: SubmitValue / get_value (the original replicated file)
+
+def SubmitValue(value, forwarded=False):
+    """
+    Client entry point.
+    The value is chosen in group 0's log and written to the replicated
+    file on every node (see PaxosGroup.submit).
+    """
+    ok, counter, detail = groups[0].submit(value, forwarded)
+    if ok:
+        return f"Proposal Num: {counter}, SubmitValue SUCCEEDED. Chosen value = {value} ({detail})"
+    return f"Proposal Num: {counter}, SubmitValue FAILED {detail}."
+
+
+def get_value(max_staleness=None, forwarded=False):
+    """
+    Return the current value of the replicated file.
+    Linearizable by default; see PaxosGroup.read for max_staleness.
+    """
+    register = groups[0].machine
+    return groups[0].read(register.read,
+                          lambda addr: _forward(addr, "get_value", max_staleness, True),
+                          max_staleness, forwarded)
+
+
+# Client-facing RPCs: key-value store
+
+def put(key, value):
+    """Set key to value. Returns True once the write is chosen; raises RuntimeError if it failed."""
+    ok, counter, detail = _group_for_key(key).submit(("put", key, value))
+    if not ok:
+        raise RuntimeError(f"put failed {detail}")
+    return True
+
+
+def delete(key):
+    """Remove key (a no-op if it is not set). Same return value as put()."""
+    ok, counter, detail = _group_for_key(key).submit(("delete", key))
+    if not ok:
+        raise RuntimeError(f"delete failed {detail}")
+    return True
+
+
+def get(key, max_staleness=None, forwarded=False):
+    """
+    Return the value stored under key, or None.
+    Linearizable by default; see PaxosGroup.read for max_staleness.
+    """
+    group = _group_for_key(key)
+    return group.read(lambda: group.machine.read(key),
+                      lambda addr: _forward(addr, "get", key, max_staleness, True),
+                      max_staleness, forwarded)
+
+
+def get_leader(key=None):
+    """
+    Where to send writes for the replicated file (key=None) or for key's
+    shard: returns (group id, (host, port) of the leader, KV_SHARDS).
+    ClusterClient (paxos_client.py) uses it to talk to leaders directly
+    instead of having every request forwarded.
+    """
+    group = groups[0] if key is None else _group_for_key(key)
+    return group.gid, group.write_target(), KV_SHARDS
+
+
+# Stats RPCs
+
+def get_stats():
+    """Counters, latency histograms and queue depths for this node (see paxos_stats.py)."""
+    snapshot = stats.snapshot()
+    snapshot["node"] = NODE_ID
+    snapshot["leader"] = bool(groups) and groups[0].leader_n is not None
+    snapshot["leading_groups"] = [g.gid for g in groups if g.leader_n is not None]
+    return snapshot
+
+
+def set_stats_mode(mode):
+    """Switch instrumentation between "off", "counters" and "full" at runtime."""
+    stats.set_mode(mode)
+    return stats.mode
+
+
+stats.gauge("batcher.pending", lambda: sum(g.batcher.pending() for g in groups))
+stats.gauge("batcher.in_flight", lambda: sum(g.batcher.in_flight() for g in groups))
+stats.gauge("wal.unsynced", lambda: sum(g.wal.backlog() for g in groups if g.wal is not None))
+stats.gauge("wal.fsyncs", lambda: sum(g.wal.fsyncs for g in groups if g.wal is not None))
+stats.gauge("learner.applied_slot", lambda: [g.applied_slot for g in groups])
+stats.gauge("learner.waiting_slots", lambda: sum(len(g.chosen_log) for g in groups))
+stats.gauge("acceptor.log_entries", lambda: sum(len(g.accepted_log) for g in groups))
+
+
+# Original RPC server (one thread per connection)
+LISTEN_BACKLOG = 128     # pending connections; Listener's default of 1 drops bursts of new peers
 
-# Original RPC server
 def rpc_server(handler, address, authkey):
-    sock = Listener(address, authkey=authkey)
+    sock = Listener(address, authkey=authkey, backlog=LISTEN_BACKLOG)
+    # Blocking RPCs from every connection, so one client can pipeline many
+    workers = ThreadPoolExecutor(max_workers=BLOCKING_WORKERS, thread_name_prefix="paxos-rpc")
     while True:
         client = sock.accept()
-        t = Thread(target=handler.handle_connection, args=(client,))
+        t = Thread(target=handler.handle_connection, args=(client, workers))
         t.daemon = True
         t.start()
 
+
+# asyncio RPC server (one event loop per node)
+# Every connection is a coroutine instead of a thread, so idle clients cost a
+# few KB each. Every RPC that touches Paxos state runs on worker threads,
+# since it takes a group's state_lock, which decide holds while it writes the
+# replica files and snapshots, and the acceptor RPCs also wait for the WAL
+# fsync. Only calls that never block (ping, get_stats) run on the loop.
+
+ASYNC_BACKLOG = 1024     # pending TCP connections the listener will queue
+ACCEPT_WORKERS = 4       # threads running the authkey handshake for new clients
+BLOCKING_WORKERS = 256   # threads for blocking RPCs (pipelining clients keep many in flight)
+
+
+def _raise_fd_limit():
+    """Allow as many open sockets as the hard limit permits."""
+    try:
+        import resource
+        soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+        if soft < hard:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+    except (ImportError, ValueError, OSError):
+        pass
+
+
+async def _read_frame(reader):
+    """Read one message framed the way multiprocessing.connection frames it."""
+    size, = struct.unpack("!i", await reader.readexactly(4))
+    if size == -1:
+        size, = struct.unpack("!Q", await reader.readexactly(8))
+    return await reader.readexactly(size)
+
+
+def _write_frame(writer, frame):
+    n = len(frame)
+    if n > 0x7fffffff:
+        writer.write(struct.pack("!iQ", -1, n) + frame)
+    else:
+        writer.write(struct.pack("!i", n) + frame)
+
+
+async def _serve_async_connection(handler, blocking_pool, reader, writer):
+    loop = asyncio.get_running_loop()
+    # Blocking RPCs answer out of order (replies carry the call id), so a
+    # client can keep many in flight on one connection
+    in_flight = set()
+
+    async def run_blocking(call_id, func_name, args, kwargs):
+        reply = await loop.run_in_executor(
+            blocking_pool, partial(handler.call, call_id, func_name, args, kwargs))
+        if not writer.is_closing():
+            _write_frame(writer, reply)
+
+    try:
+        while True:
+            call_id, func_name, args, kwargs = decode_request(await _read_frame(reader))
+            if handler.is_blocking(func_name):
+                task = loop.create_task(run_blocking(call_id, func_name, args, kwargs))
+                in_flight.add(task)
+                task.add_done_callback(in_flight.discard)
+                continue
+            _write_frame(writer, handler.call(call_id, func_name, args, kwargs))
+            await writer.drain()
+    except (asyncio.IncompleteReadError, ConnectionError, CodecError):
+        pass
+    finally:
+        writer.close()
+
+
+def _accept_thread(listener, loop, start):
+    """Accept clients and hand each authenticated socket over to the event loop."""
+    while True:
+        # Listener.accept also runs the authkey challenge, so it stays off the loop
+        try:
+            conn = listener.accept()
+        except (AuthenticationError, EOFError, OSError):
+            continue
+        sock = socket.socket(fileno=os.dup(conn.fileno()))
+        conn.close()
+        loop.call_soon_threadsafe(start, sock)
+
+
+async def async_rpc_server(handler, address, authkey):
+    _raise_fd_limit()
+    listener = Listener(address, backlog=ASYNC_BACKLOG, authkey=authkey)
+    blocking_pool = ThreadPoolExecutor(max_workers=BLOCKING_WORKERS, thread_name_prefix="paxos-rpc")
+    loop = asyncio.get_running_loop()
+    # The loop only keeps weak references to tasks, so hold on to them here
+    connections = set()
+
+    async def serve(sock):
+        reader, writer = await asyncio.open_connection(sock=sock)
+        await _serve_async_connection(handler, blocking_pool, reader, writer)
+
+    def start(sock):
+        task = loop.create_task(serve(sock))
+        connections.add(task)
+        task.add_done_callback(connections.discard)
+
+    for _ in range(ACCEPT_WORKERS):
+        Thread(target=_accept_thread, args=(listener, loop, start), daemon=True).start()
+    # Everything else happens in the connection coroutines
+    await asyncio.Event().wait()
+
+
 # Register with a handler and additional Paxos-related functions 
 handler = RPCHandler()
-handler.register_function(prepare)
-handler.register_function(accept)
-handler.register_function(SubmitValue)
-handler.register_function(get_value)
+handler.register_function(prepare, blocking=True)
+handler.register_function(accept, blocking=True)
+handler.register_function(decide, blocking=True)
+handler.register_function(SubmitValue, blocking=True)
+handler.register_function(get_value, blocking=True)
+handler.register_function(ping)
+handler.register_function(get_snapshot, blocking=True)
+handler.register_function(renew_lease, blocking=True)
+handler.register_function(get_stats)
+handler.register_function(set_stats_mode)
+handler.register_function(propose, blocking=True)
+handler.register_function(get_decided, blocking=True)
+handler.register_function(get_leader, blocking=True)
+handler.register_function(put, blocking=True)
+handler.register_function(get, blocking=True)
+handler.register_function(delete, blocking=True)
+
+
+def _parse_address(text):
+    host, _, port = text.rpartition(":")
+    return (host, int(port))
+
+
+def _set_membership(nodes, phase1_quorum=None, phase2_quorum=None):
+    """
+    Use nodes (a list of (host, port), in NODE_ID order) as the cluster.
+    Quorum sizes default to a majority; any pair with
+    phase1_quorum + phase2_quorum > len(nodes) is safe.
+    """
+    global ALL_NODES, PHASE1_QUORUM, PHASE2_QUORUM
+
+    n = len(nodes)
+    if not 1 <= n < PROPOSAL_STRIDE:
+        raise ValueError(f"a cluster needs between 1 and {PROPOSAL_STRIDE - 1} nodes, got {n}")
+    majority = n // 2 + 1
+    q1 = phase1_quorum or majority
+    q2 = phase2_quorum or majority
+    if not (1 <= q1 <= n and 1 <= q2 <= n):
+        raise ValueError(f"quorum sizes must be between 1 and {n}")
+    if q1 + q2 <= n:
+        raise ValueError(f"phase 1 and phase 2 quorums must intersect: {q1} + {q2} <= {n} nodes")
+    ALL_NODES = [tuple(addr) for addr in nodes]
+    PHASE1_QUORUM, PHASE2_QUORUM = q1, q2
+
+
+def _load_config(path):
+    """
+    Read cluster membership from a JSON file shared by every node, e.g.
+      {"nodes": ["10.128.0.2:17000", "10.128.0.3:17000", "10.128.0.5:17000"],
+       "phase1_quorum": 2, "phase2_quorum": 2}
+    The quorum entries are optional. Returns (nodes, phase1_quorum, phase2_quorum).
+    """
+    with open(path) as f:
+        config = json.load(f)
+    nodes = [_parse_address(addr) for addr in config["nodes"]]
+    return nodes, config.get("phase1_quorum"), config.get("phase2_quorum")
+
+
+def main(argv=None):
+    global NODE_ID, NODE_INDEX, FILE_NAME, WAL_FILE, SNAPSHOT_FILE, THRIFTY, KV_SHARDS
+
+    parser = argparse.ArgumentParser(description="Multi-Paxos server node")
+    parser.add_argument("--server-mode", choices=("threaded", "asyncio"), default="threaded",
+                        help="one thread per connection (default) or one asyncio event loop")
+    parser.add_argument("--config", help="JSON file listing the cluster's nodes and quorum sizes (see cluster.json)")
+    parser.add_argument("--node-id", type=int, help="this node's NODE_ID (default: the constant in this file)")
+    parser.add_argument("--peers", help="host:port of every node, comma-separated, in NODE_ID order "
+                                        "(default: ALL_NODES)")
+    parser.add_argument("--phase1-quorum", type=int, help="promises needed to become leader (default: majority)")
+    parser.add_argument("--phase2-quorum", type=int, help="accepts needed to choose a value (default: majority)")
+    parser.add_argument("--port", type=int, help="port to listen on (default: this node's port in the peer list)")
+    parser.add_argument("--data-dir", help="directory for the replica, WAL and snapshot (default: current directory)")
+    parser.add_argument("--thrifty", action="store_true",
+                        help="send prepare/accept only to the fastest quorum of peers (see THRIFTY)")
+    parser.add_argument("--shards", type=int, default=KV_SHARDS,
+                        help="key-value Paxos groups; must be the same on every node (default: KV_SHARDS)")
+    parser.add_argument("--stats-mode", choices=MODES, default=stats.mode,
+                        help="instrumentation level; \"full\" also prints every prepare/accept")
+    args = parser.parse_args(argv)
+
+    stats.set_mode(args.stats_mode)
+    THRIFTY = THRIFTY or args.thrifty
+    if args.shards < 0:
+        parser.error("--shards cannot be negative")
+    KV_SHARDS = args.shards
+
+    # Membership: config file, then command-line overrides (see paxos-bench.py)
+    try:
+        nodes, q1, q2 = _load_config(args.config) if args.config else (ALL_NODES, PHASE1_QUORUM, PHASE2_QUORUM)
+        if args.peers:
+            nodes = [_parse_address(p) for p in args.peers.split(",")]
+            q1 = q2 = None
+        _set_membership(nodes, args.phase1_quorum or q1, args.phase2_quorum or q2)
+    except (OSError, KeyError, ValueError) as e:
+        parser.error(f"bad cluster configuration: {e}")
+    if args.node_id:
+        NODE_ID = args.node_id
+        NODE_INDEX = NODE_ID - 1
+    if not 1 <= NODE_ID <= len(ALL_NODES):
+        parser.error(f"node id {NODE_ID} is not in the {len(ALL_NODES)}-node cluster")
+    if args.data_dir:
+        os.makedirs(args.data_dir, exist_ok=True)
+        FILE_NAME = os.path.join(args.data_dir, "CISC5597")
+        WAL_FILE = FILE_NAME + ".wal"
+        SNAPSHOT_FILE = FILE_NAME + ".snap"
+    port = args.port or ALL_NODES[NODE_INDEX][1]
+
+    _recover_state()
+    Thread(target=_health_check_loop, daemon=True).start()
+    # Fetch whatever was chosen while this node was down
+    for group in groups:
+        Thread(target=group._catch_up, daemon=True).start()
+    address = ('0.0.0.0', port)
+    if args.server_mode == "asyncio":
+        asyncio.run(async_rpc_server(handler, address, authkey=AUTHKEY))
+    else:
+        rpc_server(handler, address, authkey=AUTHKEY)
+
 
 # Run the server
 if __name__ == "__main__":
-    rpc_server(handler, ('0.0.0.0', 17000), authkey=AUTHKEY)
+    main()
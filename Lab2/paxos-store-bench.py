@@ -0,0 +1,127 @@
+# Benchmark: per-slot acceptor state as a dict of tuples vs. AcceptorLog.
+#
+# For each store, in a fresh process, accepts --instances slots (each value a
+# one-element batch, as the server stores them) and reports:
+#   put ops/s and sampled p99 latency, memory added (RSS), time for a full
+#   gc.collect(), random get latency, and throughput when the window is
+#   evicted every SNAPSHOT_INTERVAL slots the way snapshots do on a server.
+#
+# Run:  python3 paxos-store-bench.py [--instances 10000000] [--stores dict array]
+
+import argparse
+import gc
+import os
+import random
+import time
+from multiprocessing import get_context
+
+from paxos_store import AcceptorLog
+
+SNAPSHOT_INTERVAL = 1000
+SAMPLE_EVERY = 1000      # time one put in this many for the latency percentile
+
+
+def rss_bytes():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class DictLog(dict):
+    """The previous layout: slot -> (accepted_n, accepted_value)."""
+    def put(self, slot, n, v):
+        self[slot] = (n, v)
+
+    def evict_through(self, slot):
+        for s in [s for s in self if s <= slot]:
+            del self[s]
+
+
+STORES = {"dict": DictLog, "array": AcceptorLog}
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return 0.0
+    k = min(len(sorted_values) - 1, int(round(p / 100 * (len(sorted_values) - 1))))
+    return sorted_values[k]
+
+
+def run(kind, instances, results):
+    n = 1234501
+    store = STORES[kind]()
+    before = rss_bytes()
+    samples = []
+    start = time.perf_counter()
+    for slot in range(instances):
+        v = [f"client value {slot}"]
+        if slot % SAMPLE_EVERY == 0:
+            t = time.perf_counter()
+            store.put(slot, n, v)
+            samples.append(time.perf_counter() - t)
+        else:
+            store.put(slot, n, v)
+    fill = time.perf_counter() - start
+    memory = rss_bytes() - before
+
+    start = time.perf_counter()
+    gc.collect()
+    gc_pause = time.perf_counter() - start
+
+    rng = random.Random(1)
+    reads = [rng.randrange(instances) for _ in range(100000)]
+    start = time.perf_counter()
+    for slot in reads:
+        store.get(slot)
+    get_us = (time.perf_counter() - start) / len(reads) * 1e6
+
+    # Windowed: keep only the slots a snapshot has not covered yet
+    del store
+    gc.collect()
+    store = STORES[kind]()
+    start = time.perf_counter()
+    for slot in range(instances):
+        store.put(slot, n, [f"client value {slot}"])
+        if slot % SNAPSHOT_INTERVAL == SNAPSHOT_INTERVAL - 1:
+            store.evict_through(slot)
+    windowed = time.perf_counter() - start
+
+    samples.sort()
+    results.put({
+        "store": kind,
+        "put_ops": instances / fill,
+        "put_p99_us": percentile(samples, 99) * 1e6,
+        "memory_mb": memory / 2 ** 20,
+        "bytes_per_slot": memory / instances,
+        "gc_ms": gc_pause * 1e3,
+        "get_us": get_us,
+        "windowed_ops": instances / windowed,
+    })
+
+
+def main():
+    parser = argparse.ArgumentParser(description="acceptor state: dict of tuples vs AcceptorLog")
+    parser.add_argument("--instances", type=int, default=10000000, help="log slots to accept")
+    parser.add_argument("--stores", nargs="+", choices=sorted(STORES), default=["dict", "array"])
+    args = parser.parse_args()
+
+    ctx = get_context("fork") if hasattr(os, "fork") else get_context()
+    print(f"{args.instances} instances")
+    print(f"{'store':<6} {'put ops/s':>10} {'p99 us':>8} {'MB':>8} {'B/slot':>7} {'gc ms':>8} "
+          f"{'get us':>7} {'windowed ops/s':>15}")
+    for kind in args.stores:
+        # A fresh process per store, so memory and GC numbers do not mix
+        results = ctx.Queue()
+        p = ctx.Process(target=run, args=(kind, args.instances, results))
+        p.start()
+        r = results.get()
+        p.join()
+        print(f"{r['store']:<6} {r['put_ops']:>10.0f} {r['put_p99_us']:>8.2f} {r['memory_mb']:>8.0f} "
+              f"{r['bytes_per_slot']:>7.0f} {r['gc_ms']:>8.1f} {r['get_us']:>7.2f} {r['windowed_ops']:>15.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+# Benchmark: acceptor WAL with fsync per operation vs. group commit.
+#
+# Each of T threads repeatedly appends an ("accept", n, slot, value) record and
+# waits until it is durable, the same as concurrent accept() calls do on a
+# server. Reports throughput, fsyncs issued and p50/p99 latency per operation.
+#
+# Run:  python3 paxos-wal-bench.py [--threads 1 8 64] [--ops 200] [--dir .]
+
+import argparse
+import os
+import tempfile
+import time
+from threading import Thread
+
+from paxos_wal import WriteAheadLog
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return 0.0
+    k = min(len(sorted_values) - 1, int(round(p / 100 * (len(sorted_values) - 1))))
+    return sorted_values[k]
+
+
+def run(directory, group_commit, threads, ops):
+    path = os.path.join(directory, f"bench-{'group' if group_commit else 'per-op'}-{threads}.wal")
+    if os.path.exists(path):
+        os.remove(path)
+    wal = WriteAheadLog(path, group_commit=group_commit)
+    latencies = [[] for _ in range(threads)]
+
+    def worker(t):
+        for i in range(ops):
+            start = time.perf_counter()
+            wal.sync(("accept", 11, t * ops + i, f"value {t}-{i}"))
+            latencies[t].append(time.perf_counter() - start)
+
+    workers = [Thread(target=worker, args=(t,)) for t in range(threads)]
+    start = time.perf_counter()
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    elapsed = time.perf_counter() - start
+    wal.close()
+    os.remove(path)
+
+    all_latencies = sorted(x for per_thread in latencies for x in per_thread)
+    total = threads * ops
+    return total / elapsed, wal.fsyncs, percentile(all_latencies, 50) * 1e3, percentile(all_latencies, 99) * 1e3
+
+
+def main():
+    parser = argparse.ArgumentParser(description="WAL fsync-per-op vs group commit")
+    parser.add_argument("--threads", type=int, nargs="+", default=[1, 8, 64])
+    parser.add_argument("--ops", type=int, default=200, help="durable appends per thread")
+    parser.add_argument("--dir", default=None, help="directory for the test logs (default: a temp dir)")
+    args = parser.parse_args()
+
+    directory = args.dir or tempfile.mkdtemp(prefix="paxos-wal-bench-")
+    print(f"log directory: {directory}")
+    print(f"{'mode':<10} {'threads':>7} {'ops/s':>10} {'fsyncs':>8} {'p50 ms':>8} {'p99 ms':>8}")
+    for threads in args.threads:
+        for group_commit in (False, True):
+            ops_per_sec, fsyncs, p50, p99 = run(directory, group_commit, threads, args.ops)
+            mode = "group" if group_commit else "per-op"
+            print(f"{mode:<10} {threads:>7} {ops_per_sec:>10.0f} {fsyncs:>8} {p50:>8.2f} {p99:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
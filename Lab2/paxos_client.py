@@ -0,0 +1,284 @@
+import asyncio
+import time
+import zlib
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from multiprocessing.connection import Client
+from threading import Thread, Lock
+
+from paxos_codec import HEADER, CodecError, encode_request, decode_reply
+
+# ---------- Client-side RPC proxy ----------
+#
+# Every request frame carries a call id and the server may answer in any
+# order (SubmitValue and get_value run on worker threads there), so one
+# authenticated connection can carry many calls at once: call_async() sends
+# a request and returns a Future right away, and a reader thread matches
+# each reply to its Future by call id. Plain attribute calls, e.g.
+# proxy.SubmitValue("x"), still block until their own reply arrives.
+
+
+class RPCProxy:
+    def __init__(self, connection):
+        self._connection = connection
+        self._call_id = 0
+        self._lock = Lock()          # guards _call_id, _pending and sending
+        self._pending = {}           # call id -> Future
+        self._closed = None          # exception to fail new calls with once the connection is gone
+        self._reader = Thread(target=self._read_replies, daemon=True)
+        self._reader.start()
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+
+        def do_rpc(*args, **kwargs):
+            return self.call_async(name, *args, **kwargs).result()
+        return do_rpc
+
+    def call_async(self, name, *args, **kwargs):
+        """Send name(*args, **kwargs) and return a Future for its result."""
+        fut = Future()
+        with self._lock:
+            if self._closed is not None:
+                raise self._closed
+            self._call_id = (self._call_id + 1) & 0xFFFFFFFF
+            call_id = self._call_id
+            # One binary frame each way (see paxos_codec.py)
+            frame = encode_request(call_id, name, args, kwargs)
+            self._pending[call_id] = fut
+            try:
+                self._connection.send_bytes(frame)
+            except Exception:
+                del self._pending[call_id]
+                raise
+        return fut
+
+    async def acall(self, name, *args, **kwargs):
+        """call_async() for asyncio code: await proxy.acall("SubmitValue", v)."""
+        return await asyncio.wrap_future(self.call_async(name, *args, **kwargs))
+
+    def pending(self):
+        """Calls sent but not answered yet."""
+        return len(self._pending)
+
+    def close(self):
+        with self._lock:
+            self._closed = ConnectionError("connection closed")
+        self._connection.close()
+
+    def _read_replies(self):
+        error = ConnectionError("connection closed")
+        try:
+            while True:
+                frame = self._connection.recv_bytes()
+                if len(frame) < HEADER.size:
+                    raise CodecError("short reply frame")
+                with self._lock:
+                    fut = self._pending.pop(HEADER.unpack_from(frame)[0], None)
+                if fut is None:
+                    continue
+                try:
+                    fut.set_result(decode_reply(frame)[1])
+                except Exception as e:
+                    # The server's exception (or a malformed reply) goes to that caller
+                    fut.set_exception(e)
+        except Exception as e:
+            # EOF, a reset, or close() releasing the connection under recv_bytes()
+            if isinstance(e, CodecError):
+                error = e
+        with self._lock:
+            self._closed = error
+            pending, self._pending = self._pending, {}
+        for fut in pending.values():
+            fut.set_exception(error)
+
+
+# ---------- Cluster client ----------
+#
+# ClusterClient talks to a whole cluster instead of one node. It keeps one
+# pipelined RPCProxy per node (opened on first use and reused), remembers
+# which node leads the replicated file and each key-value shard (get_leader
+# RPC), and sends writes and linearizable reads straight to that leader, so
+# no request pays for a forward and no two nodes end up proposing against
+# each other for the same client. If a node stops answering, the client moves
+# on to the next one in the list and asks it where the leader is now. Reads
+# that accept bounded staleness go to the node with the lowest round-trip time.
+
+AUTHKEY = b'peekaboo'
+LEADER_TTL = 5.0         # seconds before a cached leader is looked up again
+CALL_TIMEOUT = 30.0      # seconds to wait for any reply before failing over
+RTT_ALPHA = 0.2          # weight of the newest sample in each node's RTT average
+# When a leader dies the others keep naming it until its lease runs out
+# (LEASE_DURATION in paxos-server-test.py), so keep trying for longer than that
+FAILOVER_PERIOD = 3.0    # seconds to keep retrying after every node has failed once
+RETRY_BACKOFF = 0.05     # first pause between rounds of retries; doubled each round
+RETRY_BACKOFF_MAX = 0.5
+
+# Errors that mean "try another node"; anything else (RPCError) is the server's answer
+FAILOVER_ERRORS = (OSError, EOFError, TimeoutError, FutureTimeoutError)
+
+# Calls that change state. Once one has been sent it is never sent to another
+# node, since the first node may still commit it.
+WRITES = ("SubmitValue", "put", "delete")
+
+
+class WriteInDoubt(Exception):
+    """A write was sent but no answer came back; it may or may not have been applied."""
+
+
+class ClusterClient:
+    def __init__(self, nodes, authkey=AUTHKEY, timeout=CALL_TIMEOUT):
+        """nodes: (host, port) of every node, e.g. ALL_NODES from paxos-server-test.py."""
+        self.nodes = [tuple(addr) for addr in nodes]
+        self._authkey = authkey
+        self._timeout = timeout
+        self._lock = Lock()
+        self._proxies = {}           # addr -> RPCProxy
+        self._rtt = {}               # addr -> moving average of round-trip time (seconds)
+        self._leaders = {}           # group id -> (addr, time looked up)
+        self._shards = None          # KV_SHARDS reported by the servers
+        self._next = 0               # where failover starts looking
+
+    # Replicated file
+
+    def SubmitValue(self, value):
+        return self._call_leader(None, "SubmitValue", value)
+
+    def get_value(self, max_staleness=None):
+        if max_staleness is not None:
+            return self._call_nearest("get_value", max_staleness)
+        return self._call_leader(None, "get_value")
+
+    # Key-value store
+
+    def put(self, key, value):
+        return self._call_leader(key, "put", key, value)
+
+    def delete(self, key):
+        return self._call_leader(key, "delete", key)
+
+    def get(self, key, max_staleness=None):
+        if max_staleness is not None:
+            return self._call_nearest("get", key, max_staleness)
+        return self._call_leader(key, "get", key)
+
+    def close(self):
+        with self._lock:
+            proxies, self._proxies = self._proxies, {}
+        for proxy in proxies.values():
+            proxy.close()
+
+    # Routing
+
+    def _group_of(self, key):
+        """Paxos group of key (0: the replicated file), or None until we know KV_SHARDS."""
+        if key is None:
+            return 0
+        if not self._shards:
+            return None
+        return 1 + zlib.crc32(key.encode()) % self._shards
+
+    def _call_leader(self, key, name, *args):
+        """
+        Call name on the leader of key's group (key None: the replicated file),
+        failing over as needed. Once every node has been tried, keeps retrying
+        with backoff for FAILOVER_PERIOD, long enough for a dead leader's
+        lease to run out and another node to take over.
+        """
+        last_error = None
+        deadline = None
+        pause = RETRY_BACKOFF
+        tries = 0
+        while True:
+            try:
+                addr = self._leader(key, self._group_of(key))
+                return self._call(addr, name, *args)
+            except Exception as e:
+                # Whatever went wrong (including WriteInDoubt or an error from
+                # the server), look the leader up again next time
+                self._leaders.pop(self._group_of(key), None)
+                if not isinstance(e, FAILOVER_ERRORS):
+                    raise
+                last_error = e
+            tries += 1
+            if tries < len(self.nodes):
+                continue
+            if deadline is None:
+                deadline = time.monotonic() + FAILOVER_PERIOD
+            elif time.monotonic() >= deadline:
+                break
+            time.sleep(pause)
+            pause = min(pause * 2, RETRY_BACKOFF_MAX)
+        raise ConnectionError(f"no node answered {name}: {last_error}")
+
+    def _call_nearest(self, name, *args):
+        """Call name on the reachable node with the lowest RTT, then the others."""
+        last_error = None
+        for addr in sorted(self.nodes, key=lambda addr: self._rtt.get(addr, float("inf"))):
+            try:
+                return self._call(addr, name, *args)
+            except FAILOVER_ERRORS as e:
+                last_error = e
+        raise ConnectionError(f"no node answered {name}: {last_error}")
+
+    def _leader(self, key, gid):
+        cached = self._leaders.get(gid)
+        if cached is not None and time.monotonic() - cached[1] < LEADER_TTL:
+            return cached[0]
+        # Ask the nodes in turn, starting after the last one that failed
+        for i in range(len(self.nodes)):
+            addr = self.nodes[(self._next + i) % len(self.nodes)]
+            try:
+                gid, leader, shards = self._call(addr, "get_leader", key)
+            except FAILOVER_ERRORS:
+                continue
+            self._shards = shards
+            leader = tuple(leader)
+            self._leaders[gid] = (leader, time.monotonic())
+            return leader
+        raise ConnectionError("no node in the cluster is reachable")
+
+    def _call(self, addr, name, *args):
+        try:
+            proxy = self._proxy(addr)
+            start = time.perf_counter()
+            fut = proxy.call_async(name, *args)
+        except FAILOVER_ERRORS:
+            # Never reached the node, so it is safe to try another
+            self._drop(addr)
+            raise
+        try:
+            result = fut.result(timeout=self._timeout)
+        except FAILOVER_ERRORS as e:
+            self._drop(addr)
+            if name in WRITES:
+                raise WriteInDoubt(f"{name} sent to {addr} but not answered ({e!r})") from e
+            raise
+        if name in ("ping", "get_leader"):
+            self._observe_rtt(addr, time.perf_counter() - start)
+        return result
+
+    def _proxy(self, addr):
+        with self._lock:
+            proxy = self._proxies.get(addr)
+            if proxy is not None and proxy._closed is None:
+                return proxy
+        proxy = RPCProxy(Client(addr, authkey=self._authkey))
+        start = time.perf_counter()
+        proxy.call_async("ping").result(timeout=self._timeout)
+        self._observe_rtt(addr, time.perf_counter() - start)
+        with self._lock:
+            self._proxies[addr] = proxy
+        return proxy
+
+    def _drop(self, addr):
+        with self._lock:
+            proxy = self._proxies.pop(addr, None)
+            self._rtt.pop(addr, None)
+            self._next = (self.nodes.index(addr) + 1) % len(self.nodes) if addr in self.nodes else self._next
+        if proxy is not None:
+            proxy.close()
+
+    def _observe_rtt(self, addr, sample):
+        old = self._rtt.get(addr)
+        self._rtt[addr] = sample if old is None else (1 - RTT_ALPHA) * old + RTT_ALPHA * sample
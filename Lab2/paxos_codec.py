@@ -0,0 +1,131 @@
+import marshal
+import struct
+
+# ---------- Wire codec shared by paxos-server-test.py and paxos-client-test.py ----------
+#
+# Every request and response is encoded exactly once into a single frame and
+# sent with Connection.send_bytes / read with Connection.recv_bytes, instead of
+# pickling a pickled tuple:
+#
+#   header:  call id (u32) | function id (u16) | kind (u8) | payload length (u32)
+#   payload: marshal encoding of the arguments or the result
+#
+# marshal only handles plain data (None, bool, int, float, str, bytes, tuple,
+# list, dict, ...). It is not safe for untrusted data: a malformed frame can
+# crash the interpreter. Frames are trusted because every connection is
+# authenticated with the cluster authkey before any frame is read.
+
+HEADER = struct.Struct("!IHBI")
+HEADER_SIZE = HEADER.size
+MARSHAL_VERSION = 4
+
+# Frame kinds
+REQUEST = 0        # payload is the args tuple
+REQUEST_KW = 1     # payload is (args, kwargs)
+REPLY = 2
+ERROR = 3
+
+# Function ids on the wire. Append new RPCs at the end so ids stay stable.
+FUNCTIONS = (
+    "prepare",
+    "accept",
+    "decide",
+    "SubmitValue",
+    "get_value",
+    "ping",
+    "get_snapshot",
+    "renew_lease",
+    "get_stats",
+    "set_stats_mode",
+    "propose",
+    "put",
+    "get",
+    "delete",
+    "get_decided",
+    "get_leader",
+)
+FUNCTION_IDS = {name: i for i, name in enumerate(FUNCTIONS)}
+
+
+class CodecError(ValueError):
+    """Raised for frames that cannot be encoded or decoded."""
+
+
+class RPCError(Exception):
+    """
+    An exception raised by the remote function. name is its type there
+    (e.g. "ValueError"); it is never re-raised as that type, so a remote
+    TimeoutError or OSError cannot be mistaken for a local network failure.
+    """
+    def __init__(self, name, message):
+        super().__init__(f"{name}: {message}")
+        self.name = name
+        self.message = message
+
+
+def _frame(call_id, func_id, kind, value):
+    try:
+        payload = marshal.dumps(value, MARSHAL_VERSION)
+    except ValueError as e:
+        raise CodecError(f"cannot encode payload: {e}") from None
+    return HEADER.pack(call_id, func_id, kind, len(payload)) + payload
+
+
+def _unframe(frame):
+    try:
+        call_id, func_id, kind, length = HEADER.unpack_from(frame)
+    except struct.error:
+        raise CodecError("short frame") from None
+    if length != len(frame) - HEADER_SIZE:
+        raise CodecError("payload length does not match frame")
+    try:
+        # Slicing bytes is cheaper than a memoryview for messages this small
+        value = marshal.loads(frame[HEADER_SIZE:])
+    except (ValueError, EOFError, TypeError) as e:
+        raise CodecError(f"malformed payload: {e}") from None
+    return call_id, func_id, kind, value
+
+
+def encode_request(call_id, func_name, args, kwargs=None):
+    try:
+        func_id = FUNCTION_IDS[func_name]
+    except KeyError:
+        raise CodecError(f"unknown function {func_name}") from None
+    if kwargs:
+        return _frame(call_id, func_id, REQUEST_KW, (tuple(args), kwargs))
+    return _frame(call_id, func_id, REQUEST, args if type(args) is tuple else tuple(args))
+
+
+def decode_request(frame):
+    """Returns (call_id, func_name, args, kwargs)."""
+    call_id, func_id, kind, body = _unframe(frame)
+    if kind == REQUEST and type(body) is tuple and func_id < len(FUNCTIONS):
+        return call_id, FUNCTIONS[func_id], body, {}
+    if (kind == REQUEST_KW and func_id < len(FUNCTIONS) and type(body) is tuple and len(body) == 2
+            and type(body[0]) is tuple and type(body[1]) is dict):
+        return call_id, FUNCTIONS[func_id], body[0], body[1]
+    raise CodecError("not a valid request frame")
+
+
+def encode_reply(call_id, func_id, result):
+    return _frame(call_id, func_id, REPLY, result)
+
+
+def encode_error(call_id, func_id, exc):
+    if isinstance(exc, RPCError):
+        # Passed on from another node (e.g. a forwarded request); keep its original type
+        return _frame(call_id, func_id, ERROR, (exc.name, exc.message))
+    return _frame(call_id, func_id, ERROR, (type(exc).__name__, str(exc)))
+
+
+def decode_reply(frame):
+    """
+    Returns (call_id, result), or raises the remote exception as RPCError.
+    """
+    call_id, func_id, kind, value = _unframe(frame)
+    if kind == REPLY:
+        return call_id, value
+    if kind == ERROR:
+        name, message = value
+        raise RPCError(name, message)
+    raise CodecError("not a valid reply frame")
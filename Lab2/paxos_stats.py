@@ -0,0 +1,164 @@
+import time
+from threading import Lock
+
+# ---------- Low-overhead node statistics ----------
+#
+# Counters, latency histograms and queue-depth gauges for one server process,
+# returned as plain dicts by the get_stats RPC. The mode can be switched at
+# runtime (set_stats_mode RPC or --stats-mode):
+#
+#   off       nothing is recorded
+#   counters  counters and histograms only (default)
+#   full      as counters, plus the per-message trace lines on stdout
+
+OFF = "off"
+COUNTERS = "counters"
+FULL = "full"
+MODES = (OFF, COUNTERS, FULL)
+
+
+class Histogram:
+    """
+    Log-linear histogram of durations in microseconds, HDR style: each power
+    of two is split into SUB_BUCKETS linear buckets, so a recorded value is
+    off by at most 1/SUB_BUCKETS and recording is a few integer operations.
+    """
+    SUB_BITS = 5
+    SUB_BUCKETS = 1 << SUB_BITS
+    MAX_VALUE = (1 << 36) - 1    # about 19 hours
+
+    def __init__(self):
+        self.counts = [0] * (self._index(self.MAX_VALUE) + 1)
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = 0
+
+    def _index(self, v):
+        if v < 2 * self.SUB_BUCKETS:
+            return v
+        shift = v.bit_length() - self.SUB_BITS - 1
+        return shift * self.SUB_BUCKETS + (v >> shift)
+
+    def _midpoint(self, i):
+        if i < 2 * self.SUB_BUCKETS:
+            return i
+        shift = i // self.SUB_BUCKETS - 1
+        low = (i - shift * self.SUB_BUCKETS) << shift
+        return low + ((1 << shift) - 1) / 2
+
+    def record(self, seconds):
+        v = min(max(int(seconds * 1e6), 0), self.MAX_VALUE)
+        self.counts[self._index(v)] += 1
+        self.count += 1
+        self.total += v
+        if self.min is None or v < self.min:
+            self.min = v
+        if v > self.max:
+            self.max = v
+
+    def percentile(self, p):
+        """Value (microseconds) at or below which p percent of the recordings fall."""
+        if not self.count:
+            return 0.0
+        rank = max(1, round(p / 100 * self.count))
+        seen = 0
+        for i, c in enumerate(self.counts):
+            seen += c
+            if seen >= rank:
+                return min(self._midpoint(i), self.max)
+        return self.max
+
+    def summary(self):
+        ms = lambda us: us / 1e3
+        return {
+            "count": self.count,
+            "min_ms": ms(self.min or 0),
+            "mean_ms": ms(self.total / self.count) if self.count else 0.0,
+            "p50_ms": ms(self.percentile(50)),
+            "p90_ms": ms(self.percentile(90)),
+            "p99_ms": ms(self.percentile(99)),
+            "p999_ms": ms(self.percentile(99.9)),
+            "max_ms": ms(self.max),
+        }
+
+
+class _Timer:
+    __slots__ = ("stats", "name", "start")
+
+    def __init__(self, stats, name):
+        self.stats = stats
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.stats.record(self.name, time.perf_counter() - self.start)
+        return False
+
+
+class Stats:
+    def __init__(self, mode=COUNTERS):
+        self.set_mode(mode)
+        self._lock = Lock()
+        self._counters = {}
+        self._histograms = {}
+        self._gauges = {}
+        self._started = time.time()
+
+    def set_mode(self, mode):
+        if mode not in MODES:
+            raise ValueError(f"stats mode must be one of {', '.join(MODES)}")
+        self.mode = mode
+        self.enabled = mode != OFF
+        self.tracing = mode == FULL
+
+    def incr(self, name, n=1):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + n
+
+    def record(self, name, seconds):
+        """Add one duration to the histogram called name."""
+        if not self.enabled:
+            return
+        with self._lock:
+            h = self._histograms.get(name)
+            if h is None:
+                h = self._histograms[name] = Histogram()
+            h.record(seconds)
+
+    def timer(self, name):
+        """with stats.timer(name): ... records how long the block took."""
+        return _Timer(self, name)
+
+    def gauge(self, name, read):
+        """Register a zero-argument function sampled on every snapshot (e.g. a queue depth)."""
+        self._gauges[name] = read
+
+    def reset(self):
+        with self._lock:
+            self._counters = {}
+            self._histograms = {}
+            self._started = time.time()
+
+    def snapshot(self):
+        with self._lock:
+            counters = dict(self._counters)
+            histograms = {name: h.summary() for name, h in self._histograms.items()}
+        gauges = {}
+        for name, read in self._gauges.items():
+            try:
+                gauges[name] = read()
+            except Exception:
+                gauges[name] = None
+        return {
+            "mode": self.mode,
+            "uptime": time.time() - self._started,
+            "counters": counters,
+            "histograms": histograms,
+            "gauges": gauges,
+        }
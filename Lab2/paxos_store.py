@@ -0,0 +1,136 @@
+import marshal
+from array import array
+
+# ---------- Compact per-slot acceptor state ----------
+#
+# An acceptor has to remember (accepted_n, accepted_value) for every log slot
+# it has accepted but not yet covered by a snapshot. Keeping that as a dict of
+# tuples costs a few hundred bytes and several GC-tracked objects per slot.
+# AcceptorLog keeps a window of slots starting at base instead:
+#
+#   ballots: array of 64-bit ints, one per slot (EMPTY = nothing accepted)
+#   offsets, lengths: where each slot's value sits in the arena
+#   arena: one bytearray holding every value, marshal-encoded
+#
+# so a slot costs 20 bytes plus its encoded value, and the cyclic GC has
+# nothing to walk. Values are decoded again only when they are read (prepare
+# replies, WAL compaction). Slots covered by a snapshot are dropped from the
+# front of the window with evict_through(); the WAL and snapshot on disk
+# already hold them.
+
+EMPTY = -1
+MARSHAL_VERSION = 4
+GROW_SLOTS = 1024        # the window grows by at least this many slots at a time
+
+
+class AcceptorLog:
+    def __init__(self):
+        self._base = 0                 # slot number of index 0
+        self._ballots = array("q")
+        self._offsets = array("q")
+        self._lengths = array("I")
+        self._arena = bytearray()
+        self._count = 0                # slots holding a value
+        self._garbage = 0              # arena bytes no longer referenced
+
+    def __len__(self):
+        return self._count
+
+    def __contains__(self, slot):
+        i = slot - self._base
+        return 0 <= i < len(self._ballots) and self._ballots[i] != EMPTY
+
+    def __getitem__(self, slot):
+        entry = self.get(slot)
+        if entry is None:
+            raise KeyError(slot)
+        return entry
+
+    def __setitem__(self, slot, entry):
+        n, v = entry
+        self.put(slot, n, v)
+
+    def put(self, slot, n, v):
+        """Record that slot accepted value v under proposal number n."""
+        i = self._index_for(slot)
+        data = marshal.dumps(v, MARSHAL_VERSION)
+        if self._ballots[i] == EMPTY:
+            self._count += 1
+        else:
+            self._garbage += self._lengths[i]
+        self._ballots[i] = n
+        self._offsets[i] = len(self._arena)
+        self._lengths[i] = len(data)
+        self._arena += data
+
+    def get(self, slot):
+        """(accepted_n, accepted_value) for slot, or None."""
+        i = slot - self._base
+        if not 0 <= i < len(self._ballots) or self._ballots[i] == EMPTY:
+            return None
+        return self._ballots[i], self._value(i)
+
+    def items(self, first_slot=None):
+        """(slot, (accepted_n, accepted_value)) for every slot >= first_slot, in slot order."""
+        start = 0 if first_slot is None else max(0, first_slot - self._base)
+        ballots = self._ballots
+        for i in range(start, len(ballots)):
+            if ballots[i] != EMPTY:
+                yield self._base + i, (ballots[i], self._value(i))
+
+    def __iter__(self):
+        return (slot for slot, _ in self.items())
+
+    def evict_through(self, slot):
+        """Forget every slot <= slot (they are covered by a snapshot)."""
+        k = min(len(self._ballots), slot - self._base + 1)
+        if k <= 0:
+            return
+        # Empty slots have length 0
+        self._count -= k - self._ballots[:k].count(EMPTY)
+        self._garbage += sum(self._lengths[:k])
+        del self._ballots[:k]
+        del self._offsets[:k]
+        del self._lengths[:k]
+        self._base += k
+        if self._garbage * 2 > len(self._arena):
+            self._compact_arena()
+
+    def nbytes(self):
+        """Memory held by the arrays and the arena."""
+        return (self._ballots.itemsize * len(self._ballots) + self._offsets.itemsize * len(self._offsets)
+                + self._lengths.itemsize * len(self._lengths) + len(self._arena))
+
+    def _value(self, i):
+        offset = self._offsets[i]
+        return marshal.loads(self._arena[offset:offset + self._lengths[i]])
+
+    def _index_for(self, slot):
+        """Index of slot, growing the window at either end to cover it."""
+        if not self._ballots:
+            self._base = slot
+        i = slot - self._base
+        if i < 0:
+            # A slot before the window (e.g. re-proposed after a restart); rare, so copying is fine
+            self._ballots[0:0] = array("q", [EMPTY]) * -i
+            self._offsets[0:0] = array("q", [0]) * -i
+            self._lengths[0:0] = array("I", [0]) * -i
+            self._base = slot
+            i = 0
+        elif i >= len(self._ballots):
+            grow = max(i + 1 - len(self._ballots), GROW_SLOTS)
+            self._ballots.extend(array("q", [EMPTY]) * grow)
+            self._offsets.extend(array("q", [0]) * grow)
+            self._lengths.extend(array("I", [0]) * grow)
+        return i
+
+    def _compact_arena(self):
+        """Copy the live values into a fresh arena."""
+        arena = bytearray()
+        for i, n in enumerate(self._ballots):
+            if n != EMPTY:
+                offset = self._offsets[i]
+                self._offsets[i] = len(arena)
+                arena += self._arena[offset:offset + self._lengths[i]]
+        self._arena = arena
+        self._garbage = 0
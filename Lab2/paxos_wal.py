@@ -0,0 +1,178 @@
+import os
+import marshal
+import struct
+import zlib
+from threading import Lock, Condition
+
+# ---------- Append-only write-ahead log with group commit ----------
+#
+# Each record is a plain tuple (e.g. ("promise", n) or ("accept", n, slot, v))
+# stored as:
+#
+#   length (u32) | crc32 of payload (u32) | marshal payload
+#
+# append() only buffers the record and hands back its log sequence number
+# (LSN); wait(lsn) returns once that record is on disk. Whichever waiter finds
+# no flush in progress writes and fsyncs everything buffered so far, so many
+# concurrent callers share a single fsync (group commit).
+
+RECORD_HEADER = struct.Struct("!II")
+MARSHAL_VERSION = 4
+
+
+def encode_record(record):
+    payload = marshal.dumps(record, MARSHAL_VERSION)
+    return RECORD_HEADER.pack(len(payload), zlib.crc32(payload)) + payload
+
+
+def read_records(path):
+    """
+    Return (records, valid_length) for the log at path. Reading stops at the
+    first torn or corrupt record, which is what a crash mid-write leaves.
+    """
+    if not os.path.exists(path):
+        return [], 0
+    with open(path, "rb") as f:
+        return decode_records(f.read())
+
+
+def decode_records(data):
+    """Same as read_records(), for bytes already in memory."""
+    records = []
+    pos = 0
+    while pos + RECORD_HEADER.size <= len(data):
+        length, crc = RECORD_HEADER.unpack_from(data, pos)
+        start = pos + RECORD_HEADER.size
+        payload = data[start:start + length]
+        if len(payload) < length or zlib.crc32(payload) != crc:
+            break
+        try:
+            records.append(marshal.loads(payload))
+        except (ValueError, EOFError, TypeError):
+            break
+        pos = start + length
+    return records, pos
+
+
+def write_atomic(path, records):
+    """
+    Replace the file at path with records, all or nothing: write a temp
+    file, fsync it, rename it over path and fsync the directory.
+    """
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(b"".join(encode_record(record) for record in records))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+    _fsync_dir(path)
+
+
+def _fsync_dir(path):
+    try:
+        fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+class WriteAheadLog:
+    def __init__(self, path, group_commit=True):
+        """
+        Opens (or creates) the log at path, dropping any torn tail left by
+        a crash. Use read_records() first to replay what is already there.
+        With group_commit=False every append is written and fsynced on its
+        own, which is only useful for comparison.
+        """
+        self.path = path
+        self.group_commit = group_commit
+        _, valid_length = read_records(path)
+        self._f = open(path, "ab")
+        if self._f.tell() != valid_length:
+            self._f.truncate(valid_length)
+            self._f.seek(valid_length)
+        self._cond = Condition(Lock())
+        self._buffer = []
+        self._appended_lsn = 0
+        self._durable_lsn = 0
+        self._flushing = False
+        self.fsyncs = 0
+
+    def append(self, record):
+        """Buffer a record and return its LSN; call wait(lsn) before relying on it."""
+        data = encode_record(record)
+        with self._cond:
+            if not self.group_commit:
+                self._f.write(data)
+                self._f.flush()
+                os.fsync(self._f.fileno())
+                self.fsyncs += 1
+                self._appended_lsn += 1
+                self._durable_lsn = self._appended_lsn
+                return self._appended_lsn
+            self._buffer.append(data)
+            self._appended_lsn += 1
+            return self._appended_lsn
+
+    def wait(self, lsn):
+        """Block until every record up to lsn has been fsynced."""
+        with self._cond:
+            while self._durable_lsn < lsn:
+                if self._flushing:
+                    # Someone else's fsync is in progress; it (or the next one) covers us
+                    self._cond.wait()
+                    continue
+                self._flushing = True
+                data = b"".join(self._buffer)
+                self._buffer = []
+                target = self._appended_lsn
+                self._cond.release()
+                try:
+                    self._f.write(data)
+                    self._f.flush()
+                    os.fsync(self._f.fileno())
+                finally:
+                    self._cond.acquire()
+                    self._flushing = False
+                    self._cond.notify_all()
+                self.fsyncs += 1
+                self._durable_lsn = target
+
+    def sync(self, record):
+        """append() and wait() in one call."""
+        self.wait(self.append(record))
+
+    def compact(self, records):
+        """
+        Atomically replace the whole log with records, which must already
+        capture the effect of every record appended so far (the caller
+        blocks appends while it builds them). Everything appended counts
+        as durable afterwards.
+        """
+        with self._cond:
+            while self._flushing:
+                self._cond.wait()
+            self._f.close()
+            write_atomic(self.path, records)
+            self._f = open(self.path, "ab")
+            self._buffer = []
+            self._durable_lsn = self._appended_lsn
+            self._cond.notify_all()
+
+    def durable_lsn(self):
+        with self._cond:
+            return self._durable_lsn
+
+    def backlog(self):
+        """Records appended but not yet on disk."""
+        with self._cond:
+            return self._appended_lsn - self._durable_lsn
+
+    def close(self):
+        with self._cond:
+            self._f.close()
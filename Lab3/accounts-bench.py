@@ -0,0 +1,98 @@
+# Benchmark: one participant hosting many accounts, one lock vs striped locks.
+#
+# Runs an AccountParticipant in this process (no RPC), with its files in a
+# temporary directory. Each of T threads repeatedly moves 1 between two random
+# accounts out of --accounts (an UPDATE transaction: prepare() + commit(),
+# durable through the WAL). --stripes 1 is the old single-lock participant;
+# with more stripes, transactions on different accounts take different locks.
+# Reports committed transactions per second and p50/p99 latency, and checks
+# that no money was created or lost.
+#
+# Run:  python3 accounts-bench.py [--threads 16] [--accounts 1 16 1024] [--stripes 1 64]
+
+import argparse
+import os
+import random
+import tempfile
+import time
+from threading import Thread
+
+from participantA import AccountParticipant
+
+START_BALANCE = 1000000
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return 0.0
+    k = min(len(sorted_values) - 1, int(round(p / 100 * (len(sorted_values) - 1))))
+    return sorted_values[k]
+
+
+def run(directory, stripes, accounts, threads, transactions):
+    tag = f"{stripes}-{accounts}-{threads}"
+    files = [os.path.join(directory, f"bench-{tag}{ext}") for ext in (".txt", ".dat", ".wal", ".log")]
+    for path in files:
+        if os.path.exists(path):
+            os.remove(path)
+    participant = AccountParticipant("A", *files, stats_mode="off", lock_stripes=stripes)
+    names = [f"acct{i}" for i in range(accounts)]
+    for name in names:
+        participant.set_balance(START_BALANCE, name)
+    per_thread = transactions // threads
+    latencies = [[] for _ in range(threads)]
+
+    def worker(t):
+        rng = random.Random(t)
+        for i in range(per_thread):
+            source, destination = rng.choice(names), rng.choice(names)
+            changes = {source: -1}
+            changes[destination] = changes.get(destination, 0) + 1
+            tx_id = f"{t}-{i}"
+            start = time.perf_counter()
+            if participant.prepare(tx_id, "UPDATE", {"changes": {"A": changes}}):
+                participant.commit(tx_id)
+            latencies[t].append(time.perf_counter() - start)
+
+    workers = [Thread(target=worker, args=(t,)) for t in range(threads)]
+    start = time.perf_counter()
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    elapsed = time.perf_counter() - start
+    assert sum(participant.get_balance(name) for name in names) == accounts * START_BALANCE
+    participant.wal.close()
+    participant.store.close()
+    for path in files:
+        if os.path.exists(path):
+            os.remove(path)
+
+    all_latencies = sorted(l for ls in latencies for l in ls)
+    return {
+        "tx_per_s": per_thread * threads / elapsed,
+        "p50_ms": percentile(all_latencies, 50) * 1e3,
+        "p99_ms": percentile(all_latencies, 99) * 1e3,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="multi-account participant: one lock vs striped locks")
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--accounts", type=int, nargs="+", default=[1, 16, 1024])
+    parser.add_argument("--stripes", type=int, nargs="+", default=[1, 64])
+    parser.add_argument("--transactions", type=int, default=4000, help="transactions per run")
+    parser.add_argument("--dir", help="directory for the files (default: a temp dir)")
+    args = parser.parse_args()
+
+    directory = args.dir or tempfile.mkdtemp(prefix="accounts-bench-")
+    print(f"{args.threads} threads")
+    print(f"{'accounts':>8} {'stripes':>7} {'tx/s':>9} {'p50 ms':>8} {'p99 ms':>8}")
+    for accounts in args.accounts:
+        for stripes in args.stripes:
+            r = run(directory, stripes, accounts, args.threads, args.transactions)
+            print(f"{accounts:>8} {stripes:>7} {r['tx_per_s']:>9.0f} {r['p50_ms']:>8.2f} {r['p99_ms']:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
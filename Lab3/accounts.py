@@ -0,0 +1,149 @@
+# accounts.py
+#
+# Account balances for a participant that hosts many accounts.
+#
+# AccountStore: an in-memory dict from account name to balance, backed by a
+# memory-mapped file of fixed-width records, so a change rewrites 8 bytes in
+# place instead of the whole file:
+#
+#   header:  magic "ACCT" | version (u32) | number of accounts (u64)
+#   record:  name (32 bytes, UTF-8, zero padded) | balance (i64)
+#
+# Writes to the map are not fsynced one at a time. The WAL (wal.py) is what
+# makes a change durable: a participant only changes a balance here once the
+# WAL record carrying it (as an absolute balance) is on disk. The file is
+# therefore never ahead of the log, only behind it, and replaying the log over
+# it brings back anything the OS had not written back before a crash.
+# flush() is only needed before the WAL is compacted.
+#
+# LockTable: a fixed table of locks that account names hash to (lock
+# striping), so transactions on different accounts rarely share a lock.
+
+import mmap
+import os
+import struct
+import threading
+import zlib
+from contextlib import contextmanager
+
+HEADER = struct.Struct("!4sIQ")
+RECORD = struct.Struct("!32sq")
+BALANCE = struct.Struct("!q")
+NAME_BYTES = 32
+MAGIC = b"ACCT"
+VERSION = 1
+INITIAL_CAPACITY = 1024     # records the file has room for at first; doubled when full
+
+LOCK_STRIPES = 64
+
+
+def valid_name(name):
+    """True if name fits in a record: 1 to NAME_BYTES bytes of UTF-8, with no NUL (the padding)."""
+    try:
+        data = name.encode()
+    except (AttributeError, UnicodeEncodeError):
+        return False
+    return 0 < len(data) <= NAME_BYTES and b"\0" not in data
+
+
+class AccountStore:
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()      # guards creating accounts (and growing the map)
+        self._slots = {}                   # name -> record number
+        self._balances = {}                # name -> balance
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        if os.fstat(self._fd).st_size < HEADER.size:
+            os.ftruncate(self._fd, HEADER.size + INITIAL_CAPACITY * RECORD.size)
+            self._map = mmap.mmap(self._fd, 0)
+            HEADER.pack_into(self._map, 0, MAGIC, VERSION, 0)
+        else:
+            self._map = mmap.mmap(self._fd, 0)
+            magic, version, count = HEADER.unpack_from(self._map, 0)
+            if magic != MAGIC or version != VERSION:
+                raise ValueError(f"{path} is not an account file (version {VERSION})")
+            for slot in range(count):
+                name, balance = RECORD.unpack_from(self._map, HEADER.size + slot * RECORD.size)
+                name = name.rstrip(b"\0").decode()
+                self._slots[name] = slot
+                self._balances[name] = balance
+
+    def __contains__(self, name):
+        return name in self._balances
+
+    def __len__(self):
+        return len(self._balances)
+
+    def get(self, name, default=0):
+        """Balance of name (default if the account does not exist yet). Takes no lock."""
+        return self._balances.get(name, default)
+
+    def ensure(self, name):
+        """Create account name (balance 0) if it does not exist. ValueError for a bad name."""
+        slot = self._slots.get(name)
+        if slot is None:
+            slot = self._create(name)
+        return slot
+
+    def set(self, name, balance):
+        """Set name's balance, creating the account if needed. The caller holds name's lock."""
+        slot = self.ensure(name)
+        self._balances[name] = balance
+        BALANCE.pack_into(self._map, HEADER.size + slot * RECORD.size + NAME_BYTES, balance)
+
+    def flush(self):
+        """Write every change made so far to disk."""
+        self._map.flush()
+
+    def close(self):
+        self._map.close()
+        os.close(self._fd)
+
+    def _create(self, name):
+        if not valid_name(name):
+            raise ValueError(f"account name must be 1 to {NAME_BYTES} bytes: {name!r}")
+        with self._lock:
+            slot = len(self._slots)
+            offset = HEADER.size + slot * RECORD.size
+            if offset + RECORD.size > len(self._map):
+                # Grows the file as well
+                self._map.resize(HEADER.size + 2 * (len(self._map) - HEADER.size))
+            RECORD.pack_into(self._map, offset, name.encode(), 0)
+            HEADER.pack_into(self._map, 0, MAGIC, VERSION, slot + 1)
+            self._slots[name] = slot
+        return slot
+
+
+class LockTable:
+    """
+    Locks for accounts, by hashing each name onto one of stripes locks.
+    hold() takes every lock a transaction needs in index order, so two
+    transactions never wait for each other in a cycle.
+    """
+    def __init__(self, stripes=LOCK_STRIPES):
+        self._locks = [threading.Lock() for _ in range(max(1, stripes))]
+
+    def indexes(self, names):
+        return sorted({zlib.crc32(name.encode()) % len(self._locks) for name in names})
+
+    @contextmanager
+    def hold(self, names):
+        held = [self._locks[i] for i in self.indexes(names)]
+        for lock in held:
+            lock.acquire()
+        try:
+            yield
+        finally:
+            for lock in reversed(held):
+                lock.release()
+
+    @contextmanager
+    def hold_all(self):
+        """Every lock, e.g. to checkpoint while no transaction is changing anything."""
+        for lock in self._locks:
+            lock.acquire()
+        try:
+            yield
+        finally:
+            for lock in reversed(self._locks):
+                lock.release()
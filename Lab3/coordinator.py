@@ -5,14 +5,21 @@
 #   - Exposes RPC for the client:
 #       run_transfer_100_scenario()
 #       run_bonus_20_percent_scenario()
+#       run_transfer(source, destination, amount)  (any accounts, e.g. "A:alice" -> "B:bob")
 #
 # The client can call these to trigger the transactions
 
-from xmlrpc.server import SimpleXMLRPCServer
-from xmlrpc.client import ServerProxy
+from concurrent.futures import ThreadPoolExecutor, as_completed, TimeoutError as FanOutTimeout
 import time
 import uuid
 import os
+import socket
+import threading
+
+from stats import Stats
+from logger import AsyncLog, DEBUG, INFO, WARNING
+from rpc import ThreadedXMLRPCServer, ProxyPool, POOL_SIZE
+from accounts import NAME_BYTES, valid_name
 
 # This server runs on node-0
 HOST = "10.128.0.2"   # node-0 internal IP
@@ -22,84 +29,159 @@ PORT = 8000           # RPC port for coordinator
 NODE1_URL = "http://10.128.0.3:8001/"   # node-1 (A)
 NODE2_URL = "http://10.128.0.5:8002/"   # node-2 (B)
 
+# Every participant in the 2PC, by account name. Add entries to run transactions
+# across more nodes; the scenario helpers below only use A and B.
+PARTICIPANTS = {"A": NODE1_URL, "B": NODE2_URL}
+
+# Seconds to wait for a participant's reply before treating it as a NO vote
+PARTICIPANT_TIMEOUT = 5.0
+
 # All Coordinator log messages will go to this file
 LOG_FILE = "log_node0_coordinator.txt"
 
+# Instrumentation level at startup: "off", "counters" or "full" (full also echoes the log to the console).
+# Can be changed while running with set_stats_mode().
+STATS_MODE = "counters"
+
+# Log lines below this level are skipped: "DEBUG" (also every HTTP request), "INFO" (default),
+# "WARNING" (only errors and timeouts, for heavy load). Can be changed while running with set_log_level().
+LOG_LEVEL = "INFO"
+# "text" (one readable line per event) or "json" (one JSON object per line)
+LOG_FORMAT = "text"
+
 
 class Coordinator:
-    def __init__(self, node1_url, node2_url, log_file):
-        self.pA = ServerProxy(node1_url, allow_none=True)  # Creates a remote object (participant A)
-        self.pB = ServerProxy(node2_url, allow_none=True)  # Creates a remote object (participant B)
+    def __init__(self, participant_urls, log_file, stats_mode=STATS_MODE):
+        self.participants = dict(participant_urls)         # e.g. {"A": node-1's URL, "B": node-2's URL}
+        # Keep-alive connections to each participant, shared by every client request
+        self.pools = {name: ProxyPool(url, timeout=PARTICIPANT_TIMEOUT) for name, url in self.participants.items()}
+        # Sends each phase to every participant at once, for many transactions at a time
+        self.executor = ThreadPoolExecutor(max_workers=max(1, POOL_SIZE * len(self.participants)))
         self.log_file = log_file
+        self.stats = Stats(stats_mode)
+        # Written by a background thread, so logging never waits on the disk (see logger.py)
+        self.log = AsyncLog(log_file, "COORD", LOG_LEVEL, LOG_FORMAT, console=self.stats.tracing)
+        self.stats.gauge("log_backlog", self.log.backlog)
+        self.in_progress = 0                               # 2PC transactions currently running
+        self.in_progress_lock = threading.Lock()           # Client requests run on their own threads
+        self.stats.gauge("transactions_in_progress", lambda: self.in_progress)
         self._log("Coordinator initialized")
 
     # Creates a time stamped log line with [COORD] as a prefix
     # Helps digest the log as it makes it clear where the line is coming from
     # Used as a way to write to the log whenever an action is committed
-    def _log(self, msg):
-        ts = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime())
-        line = f"[{ts}] [COORD] {msg}"
-        print(line)
-        with open(self.log_file, "a") as f:
-            f.write(line + "\n")
+    # Only queues the line; logger.py writes it in the background. fields show up in the json format
+    def _log(self, msg, level=INFO, **fields):
+        self.log.log(msg, level, **fields)
+
+    # Times every client RPC; SimpleXMLRPCServer calls this instead of looking the method up itself
+    def _dispatch(self, method, params):
+        func = None if method.startswith("_") else getattr(self, method, None)
+        if not callable(func):
+            raise Exception(f'method "{method}" is not supported')
+        with self.stats.timer("rpc." + method):
+            return func(*params)
+
+    # Counts a failed participant call; timeouts are counted separately
+    def _participant_error(self, e):
+        if isinstance(e, (socket.timeout, TimeoutError)):
+            self.stats.incr("timeouts")
+        else:
+            self.stats.incr("participant_errors")
+
+    # Calls method(*args) on one participant over a pooled keep-alive connection
+    def _call(self, name, method, *args):
+        return self.pools[name].call(method, *args)
+
+    # Calls method(*args) on every participant at once and returns {name: reply or the exception raised}.
+    # If stop_if(reply) is true for a reply, returns right away without waiting for the rest
+    # (participants that have not answered yet are left out). A participant that does not
+    # answer within PARTICIPANT_TIMEOUT gets a TimeoutError.
+    def _fan_out(self, method, *args, stop_if=None, names=None):
+        futures = {self.executor.submit(self._call, name, method, *args): name
+                   for name in (self.participants if names is None else names)}
+        replies = {}
+        try:
+            for fut in as_completed(futures, timeout=PARTICIPANT_TIMEOUT):
+                name = futures[fut]
+                try:
+                    replies[name] = fut.result()
+                except Exception as e:
+                    replies[name] = e
+                if stop_if is not None and stop_if(replies[name]):
+                    break
+        except FanOutTimeout:
+            for fut, name in futures.items():
+                if name not in replies:
+                    replies[name] = TimeoutError(f"no reply within {PARTICIPANT_TIMEOUT}s")
+        return replies
 
     # --------- Generic 2PC driver ---------
     # tx_type is a string like "T1_TRANSFER_100" or "T2_BONUS"
-    def _two_phase_commit(self, tx_type, params=None):
+    # participants: the ones the transaction touches (default: all of them)
+    def _two_phase_commit(self, tx_type, params=None, participants=None):
+        self.stats.incr("transactions")
+        with self.in_progress_lock:
+            self.in_progress += 1
+        try:
+            with self.stats.timer("2pc.total"):
+                return self._run_two_phase_commit(tx_type, params, participants)
+        finally:
+            with self.in_progress_lock:
+                self.in_progress -= 1
+
+    def _run_two_phase_commit(self, tx_type, params=None, participants=None):
         if params is None:
             params = {}
+        if participants is None:
+            participants = list(self.participants)
 
         # Generates a unique transaction ID that is used during logging
         tx_id = str(uuid.uuid4())
-        self._log(f"Starting 2PC tx_id={tx_id}, type={tx_type}, params={params}")
+        self._log(f"Starting 2PC tx_id={tx_id}, type={tx_type}, params={params}", tx_id=tx_id, tx_type=tx_type)
 
-        # Phase 1: PREPARE
-        try:
-            # Expects prepare to return a vote (True=yes, False=no)
-            # If a network error/exception occurs, this is treated as a "no"
-            vote_A = self.pA.prepare(tx_id, tx_type, params)
-            self._log(f"Vote from A: {vote_A}")
-        except Exception as e:
-            self._log(f"Exception contacting A during prepare: {e}")
-            vote_A = False
-
-        try:
-            # Expects prepare to return a vote (True=yes, False=no)
-            # If a network error/exception occurs, this is treated as a "no"
-            vote_B = self.pB.prepare(tx_id, tx_type, params)
-            self._log(f"Vote from B: {vote_B}")
-        except Exception as e:
-            self._log(f"Exception contacting B during prepare: {e}")
-            vote_B = False
+        # Phase 1: PREPARE, sent to every participant in the transaction at once
+        # Expects prepare to return a vote (True=yes, False=no)
+        # A network error, exception or timeout is treated as a "no", and the first "no" ends the phase
+        phase_start = time.perf_counter()
+        votes = self._fan_out("prepare", tx_id, tx_type, params, stop_if=lambda vote: vote is not True,
+                              names=participants)
+        for name, vote in votes.items():
+            if isinstance(vote, Exception):
+                self._log(f"Exception contacting {name} during prepare: {vote}", WARNING)
+                self._participant_error(vote)
+            else:
+                self._log(f"Vote from {name}: {vote}")
+        self.stats.record("2pc.prepare", time.perf_counter() - phase_start)
 
-        # Combines response from both participants
-        all_yes = (vote_A and vote_B)
+        # Combines the responses from all participants
+        all_yes = len(votes) == len(participants) and all(vote is True for vote in votes.values())
 
-        # Phase 2: COMMIT or ABORT
-        # Will only execute if both participant nodes vote "yes"
+        # Phase 2: COMMIT or ABORT, again to the same participants at once
+        # Will only commit if every participant voted "yes"
+        phase_start = time.perf_counter()
         if all_yes:
             self._log(f"All YES; sending COMMIT for tx_id={tx_id}")
-            try:
-                self.pA.commit(tx_id)
-            except Exception as e:
-                self._log(f"Error sending COMMIT to A: {e}")
-            try:
-                self.pB.commit(tx_id)
-            except Exception as e:
-                self._log(f"Error sending COMMIT to B: {e}")
-            self._log(f"Transaction {tx_id} committed.")
+            for name, reply in self._fan_out("commit", tx_id, names=participants).items():
+                if isinstance(reply, Exception):
+                    self._log(f"Error sending COMMIT to {name}: {reply}", WARNING)
+                    self._participant_error(reply)
+            self.stats.record("2pc.commit", time.perf_counter() - phase_start)
+            self.stats.incr("committed")
+            self._log(f"Transaction {tx_id} committed.", tx_id=tx_id, outcome="commit")
             return True    # Indicating success
-        else:    # Log that we are aborting in the event that one (or both) of the participants vote "no"
+        else:    # Log that we are aborting in the event that one (or more) of the participants vote "no"
+            if len(votes) < len(participants):
+                # Aborted on the first "no" without waiting for every vote
+                self.stats.incr("early_aborts")
             self._log(f"At least one NO; sending ABORT for tx_id={tx_id}")
-            try:
-                self.pA.abort(tx_id)
-            except Exception as e:
-                self._log(f"Error sending ABORT to A: {e}")
-            try:
-                self.pB.abort(tx_id)
-            except Exception as e:
-                self._log(f"Error sending ABORT to B: {e}")
-            self._log(f"Transaction {tx_id} aborted.")
+            for name, reply in self._fan_out("abort", tx_id, names=participants).items():
+                if isinstance(reply, Exception):
+                    self._log(f"Error sending ABORT to {name}: {reply}", WARNING)
+                    self._participant_error(reply)
+            self.stats.record("2pc.abort", time.perf_counter() - phase_start)
+            self.stats.incr("aborted")
+            self._log(f"Transaction {tx_id} aborted.", tx_id=tx_id, outcome="abort")
             return False    # Indicating failure
 
     # --------- Scenario helpers exposed to client ---------
@@ -107,8 +189,8 @@ class Coordinator:
     def initialize_balances(self, a_value, b_value):
         # Based on parameters set by assignment
         self._log(f"Initializing balances: A={a_value}, B={b_value}")
-        self.pA.set_balance(int(a_value))
-        self.pB.set_balance(int(b_value))
+        self._call("A", "set_balance", int(a_value))
+        self._call("B", "set_balance", int(b_value))
         return True
 
     def run_transfer_100(self):
@@ -126,9 +208,9 @@ class Coordinator:
         self._log("Client requested: run_bonus_20_percent")
         
         try:
-            a_balance = self.pA.get_balance()
+            a_balance = self._call("A", "get_balance")
         except Exception as e:
-            self._log(f"Failed to read A balance: {e}")
+            self._log(f"Failed to read A balance: {e}", WARNING)
             return False
 
         bonus = int(0.2 * a_balance)
@@ -137,17 +219,60 @@ class Coordinator:
         success = self._two_phase_commit("T2_BONUS", params)
         return success    # Returns True/False to the client depending on whether or not it is successful
 
+    def run_transfer(self, source, destination, amount):
+        """
+        Move amount between any two accounts, each named "<participant>:<account>",
+        e.g. run_transfer("A:alice", "B:bob", 25). Both may be on the same participant,
+        and only the participants involved take part in the 2PC.
+        """
+        if int(amount) <= 0:
+            raise ValueError(f"amount must be positive, got {amount!r}")
+        changes = {}
+        for ref, delta in ((source, -int(amount)), (destination, int(amount))):
+            name, _, account = ref.partition(":")
+            if name not in self.participants or not valid_name(account):
+                raise ValueError(f"bad account {ref!r}, expected <participant>:<account> "
+                                 f"with an account name of 1 to {NAME_BYTES} bytes")
+            node_changes = changes.setdefault(name, {})
+            node_changes[account] = node_changes.get(account, 0) + delta
+        self._log(f"Client requested: run_transfer {source} -> {destination}, amount={amount}")
+        return self._two_phase_commit("UPDATE", {"changes": changes}, list(changes))
+
     # Lets the client ask the coordinator for both account balances in one call
     def get_balances(self):
         try:
-            a_balance = self.pA.get_balance()
-            b_balance = self.pB.get_balance()
+            a_balance = self._call("A", "get_balance")
+            b_balance = self._call("B", "get_balance")
         except Exception as e:
-            self._log(f"Error reading balances: {e}")
+            self._log(f"Error reading balances: {e}", WARNING)
             return {"error": str(e)}
-        self._log(f"get_balances -> A={a_balance}, B={b_balance}")
+        self._log(f"get_balances -> A={a_balance}, B={b_balance}", DEBUG)
         return {"A": a_balance, "B": b_balance}
 
+    # Counters, latency histograms and gauges (see stats.py)
+    # With participants=True the participants' own stats are included under "participants"
+    def get_stats(self, participants=False):
+        snapshot = self.stats.snapshot()
+        snapshot["node"] = "COORD"
+        if participants:
+            snapshot["participants"] = {}
+            for name in self.participants:
+                try:
+                    snapshot["participants"][name] = self._call(name, "get_stats")
+                except Exception as e:
+                    snapshot["participants"][name] = {"error": str(e)}
+        return snapshot
+
+    # Switches instrumentation between "off", "counters" and "full" at runtime
+    def set_stats_mode(self, mode):
+        self.stats.set_mode(mode)
+        self.log.console = self.stats.tracing
+        return self.stats.mode
+
+    # Changes which log lines are kept ("DEBUG", "INFO", "WARNING" or "ERROR") at runtime
+    def set_log_level(self, level):
+        return self.log.set_level(level)
+
 
 def main():
     # Create log file if missing
@@ -155,9 +280,10 @@ def main():
         with open(LOG_FILE, "w") as f:
             f.write("")
 
-    # Creates the XML-RPC server bound to the HOST and PORT
-    server = SimpleXMLRPCServer((HOST, PORT), allow_none=True, logRequests=True)
-    coord = Coordinator(NODE1_URL, NODE2_URL, LOG_FILE)    # Instantiate coordinator object
+    # Creates the XML-RPC server bound to the HOST and PORT; each client connection gets its own thread
+    server = ThreadedXMLRPCServer((HOST, PORT), allow_none=True, logRequests=True)
+    coord = Coordinator(PARTICIPANTS, LOG_FILE)            # Instantiate coordinator object
+    server.log = coord.log                                 # HTTP request lines go to the log at DEBUG level
     server.register_instance(coord)                        # Makes all public methods on coord callable
     
     # Startup message and looping
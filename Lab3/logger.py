@@ -0,0 +1,167 @@
+# logger.py
+#
+# Asynchronous log for the coordinator and the participants. log() only puts
+# the record on a queue, so callers (often holding the participant's lock)
+# never wait for the disk or the console. A writer thread takes whatever has
+# queued up, formats it and appends it to the log file with one write, and
+# rotates the file once it reaches max_bytes:
+#
+#   log_node1_A.txt -> log_node1_A.txt.1 -> ... -> log_node1_A.txt.<backups>
+#
+# Records below the level are dropped before they are queued. Formats:
+#
+#   text   [2025-12-04 10:00:00] [A] PREPARE received: ...   (default)
+#   json   {"ts": 1764842400.12, "time": "...", "node": "A", "level": "INFO", "msg": "...", ...}
+
+import atexit
+import json
+import os
+import queue
+import threading
+import time
+
+DEBUG = 10
+INFO = 20
+WARNING = 30
+ERROR = 40
+LEVELS = {"DEBUG": DEBUG, "INFO": INFO, "WARNING": WARNING, "ERROR": ERROR}
+LEVEL_NAMES = {v: k for k, v in LEVELS.items()}
+
+FORMATS = ("text", "json")
+MAX_BYTES = 10 * 2 ** 20     # rotate the log file at this size
+BACKUPS = 3                  # rotated files to keep
+BATCH = 1024                 # most records written with one write()
+MAX_QUEUE = 100000           # records waiting beyond this are dropped (and counted)
+
+
+def parse_level(level):
+    """Level number for "DEBUG"/"INFO"/"WARNING"/"ERROR" (or a number)."""
+    if isinstance(level, str):
+        if level.upper() not in LEVELS:
+            raise ValueError(f"unknown log level {level!r}, expected one of {', '.join(LEVELS)}")
+        return LEVELS[level.upper()]
+    return int(level)
+
+
+class AsyncLog:
+    def __init__(self, path, node, level=INFO, fmt="text", console=False,
+                 max_bytes=MAX_BYTES, backups=BACKUPS):
+        if fmt not in FORMATS:
+            raise ValueError(f"unknown log format {fmt!r}, expected one of {', '.join(FORMATS)}")
+        self.path = path
+        self.node = node
+        self.level = parse_level(level)
+        self.fmt = fmt
+        self.console = console       # also print each line (can be changed at any time)
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.dropped = 0
+        self._queue = queue.SimpleQueue()
+        self._f = open(path, "a")
+        self._size = self._f.tell()
+        self._stamp = (None, "")     # (second, formatted time) of the last record
+        self._writer = threading.Thread(target=self._write_loop, daemon=True)
+        self._writer.start()
+        atexit.register(self.close)
+
+    def log(self, msg, level=INFO, **fields):
+        """Queue msg for the log file; extra fields only show up in the json format."""
+        if level < self.level:
+            return
+        if self._queue.qsize() >= MAX_QUEUE:
+            self.dropped += 1
+            return
+        self._queue.put((time.time(), level, msg, fields))
+
+    def debug(self, msg, **fields):
+        self.log(msg, DEBUG, **fields)
+
+    def info(self, msg, **fields):
+        self.log(msg, INFO, **fields)
+
+    def warning(self, msg, **fields):
+        self.log(msg, WARNING, **fields)
+
+    def error(self, msg, **fields):
+        self.log(msg, ERROR, **fields)
+
+    def set_level(self, level):
+        self.level = parse_level(level)
+        return LEVEL_NAMES.get(self.level, self.level)
+
+    def backlog(self):
+        """Records queued but not written yet."""
+        return self._queue.qsize()
+
+    def flush(self):
+        """Block until everything logged so far is in the file."""
+        if not self._writer.is_alive():
+            return
+        done = threading.Event()
+        self._queue.put(done)
+        done.wait()
+
+    def close(self):
+        if self._writer.is_alive():
+            self._queue.put(None)
+            self._writer.join()
+
+    def _write_loop(self):
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < BATCH:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            lines = []
+            stop = False
+            waiters = []
+            for record in batch:
+                if record is None:
+                    stop = True
+                elif isinstance(record, threading.Event):
+                    waiters.append(record)
+                else:
+                    lines.append(self._format(*record))
+            if lines:
+                try:
+                    self._write("".join(line + "\n" for line in lines))
+                except OSError as e:
+                    print(f"[{self.node}] could not write {self.path}: {e}")
+                if self.console:
+                    print("\n".join(lines), flush=True)
+            for done in waiters:
+                done.set()
+            if stop:
+                self._f.close()
+                return
+
+    def _format(self, ts, level, msg, fields):
+        second = int(ts)
+        if self._stamp[0] != second:
+            self._stamp = (second, time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(second)))
+        if self.fmt == "json":
+            record = {"ts": round(ts, 6), "time": self._stamp[1], "node": self.node,
+                      "level": LEVEL_NAMES.get(level, level), "msg": msg}
+            record.update(fields)
+            return json.dumps(record, default=str)
+        return f"[{self._stamp[1]}] [{self.node}] {msg}"
+
+    def _write(self, data):
+        if self._size + len(data) > self.max_bytes and self._size > 0:
+            self._rotate()
+        self._f.write(data)
+        self._f.flush()
+        self._size += len(data)
+
+    def _rotate(self):
+        self._f.close()
+        for i in range(self.backups, 0, -1):
+            src = self.path if i == 1 else f"{self.path}.{i - 1}"
+            if os.path.exists(src):
+                os.replace(src, f"{self.path}.{i}")
+        if self.backups == 0:
+            os.remove(self.path)
+        self._f = open(self.path, "a")
+        self._size = 0
@@ -1,41 +1,90 @@
 # participantA.py
 #
 # Node1 = participant that manages account A.
+# It can host any number of other accounts too (see accounts.py); account A
+# is the one the lab's transactions use.
 # Exposes RPC methods to take part in 2PC:
 #   - prepare(transaction_id, tx_type, params)
 #   - commit(transaction_id)
 #   - abort(transaction_id)
-#   - get_balance()
-#   - set_balance(new_value)  (for initializing scenarios)
+#   - get_balance(account=None)
+#   - set_balance(new_value, account=None)  (for initializing scenarios)
 #
 # Adjust HOST / PORT for your node1 machine.
 
-from xmlrpc.server import SimpleXMLRPCServer
 import threading
 import time
 import os
+from collections import OrderedDict
+
+from stats import Stats
+from logger import AsyncLog, DEBUG, INFO, WARNING, ERROR
+from rpc import ThreadedXMLRPCServer
+from wal import WriteAheadLog, read_records, replay
+from accounts import AccountStore, LockTable, LOCK_STRIPES, NAME_BYTES, valid_name
 
 HOST = "10.128.0.3"   # node-1 internal IP
 PORT = 8001
 
 
-ACCOUNT_NAME = "A"                # The name used in logs
-ACCOUNT_FILE = "account_A.txt"    # Stores a balance as a single integer
+ACCOUNT_NAME = "A"                # The name used in logs, and this node's own account
+ACCOUNT_FILE = "account_A.txt"    # Readable copy of account A's balance, refreshed every CHECKPOINT_INTERVAL
+STORE_FILE = "accounts_A.dat"     # Every account's balance (see accounts.py)
+WAL_FILE = "account_A.wal"        # Write-ahead log of every balance change (see wal.py)
 LOG_FILE = "log_node1_A.txt"      # Log file
 
 # Crash simulation flags for requirement 1.c
 CRASH_BEFORE_VOTE = False    # Set to True to simulate a crash before the participants vote
 CRASH_AFTER_VOTE = False     # Set to True to simulate a crash after the participants vote, but before they commit
 
+# Instrumentation level at startup: "off", "counters" or "full" (full also echoes the log to the console).
+# Can be changed while running with set_stats_mode().
+STATS_MODE = "counters"
+
+# Log lines below this level are skipped: "DEBUG" (also every HTTP request), "INFO" (default),
+# "WARNING" (only errors and timeouts, for heavy load). Can be changed while running with set_log_level().
+LOG_LEVEL = "INFO"
+# "text" (one readable line per event) or "json" (one JSON object per line)
+LOG_FORMAT = "text"
+
+# How many aborted transaction ids to remember, so that a PREPARE arriving after
+# its ABORT (the coordinator aborts on the first NO or timeout) votes NO
+ABORTED_MEMORY = 10000
+
+# Once the WAL holds this many records, STORE_FILE is flushed to disk and the WAL
+# is rewritten with only the in-doubt transactions
+CHECKPOINT_RECORDS = 10000
+# Seconds between checkpoint checks and refreshes of ACCOUNT_FILE
+CHECKPOINT_INTERVAL = 1.0
+
 
 class AccountParticipant:
-    def __init__(self, account_name, account_file, log_file):
+    def __init__(self, account_name, account_file, store_file, wal_file, log_file,
+                 stats_mode=STATS_MODE, lock_stripes=LOCK_STRIPES):
         self.account_name = account_name
         self.account_file = account_file
+        self.wal_file = wal_file
         self.log_file = log_file
-        self.prepared_transactions = {}
-        self.lock = threading.Lock()        # Only one thread at a time can read/write balances
-        self._ensure_account_file()         # Create account file if it doesn't exist
+        self.prepared_transactions = {}             # tx_id -> {account: change}
+        self.reserved = {}                          # account -> money promised to prepared transactions (<= 0)
+        self.aborted_transactions = OrderedDict()   # tx ids aborted before they were prepared here
+        # Each account has its own lock (striped, see accounts.py), so transactions on
+        # different accounts run side by side. tx_lock guards prepared_transactions and
+        # aborted_transactions; it is always taken after the account locks, never before
+        self.locks = LockTable(lock_stripes)
+        self.tx_lock = threading.Lock()
+        self.stats = Stats(stats_mode)
+        # Written by a background thread, so logging never waits on the disk (see logger.py)
+        self.log = AsyncLog(log_file, account_name, LOG_LEVEL, LOG_FORMAT, console=self.stats.tracing)
+        self.stats.gauge("log_backlog", self.log.backlog)
+        self.store = AccountStore(store_file)
+        self.written_balance = None         # Balance last copied to the account file
+        self._recover()                     # Balances and in-doubt transactions from the WAL
+        self.stats.gauge("accounts", lambda: len(self.store))
+        self.stats.gauge("prepared_transactions", lambda: len(self.prepared_transactions))
+        self.stats.gauge("wal.fsyncs", lambda: self.wal.fsyncs)
+        self.stats.gauge("wal.records", lambda: self.wal.records)
+        threading.Thread(target=self._checkpoint_loop, daemon=True).start()
 
     # ---------- Internal helpers ----------
     
@@ -46,118 +95,259 @@ class AccountParticipant:
                 f.write("0\n")
 
     # Logs a timestamped message prefixed with [A]
-    # Prints to the console and appends to the log_node1_A.txt file
-    def _log(self, msg):
-        timestamp = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime())
-        line = f"[{timestamp}] [{self.account_name}] {msg}"
-        print(line)
-        with open(self.log_file, "a") as f:
-            f.write(line + "\n")
-
-    def _read_balance(self):
-        """Reads the current balance from the account file."""
-        with open(self.account_file, "r") as f:
-            return int(f.read().strip())
-
-    def _write_balance(self, value):
-        """Overwrites the file with the new balance from the commits."""
-        with open(self.account_file, "w") as f:
-            f.write(str(value) + "\n")
+    # Queued for the log_node1_A.txt file (and the console in "full" mode) without waiting,
+    # since it is often called with account locks held. fields show up in the json format
+    def _log(self, msg, level=INFO, **fields):
+        self.log.log(msg, level, **fields)
+
+    def _recover(self):
+        """
+        Bring the store up to date from the WAL and restore any in-doubt prepared
+        transactions. On the very first start account A's balance comes from the
+        account file.
+        """
+        records, _ = read_records(self.wal_file)
+        balances, self.prepared_transactions = replay(records)
+        for account, balance in balances.items():
+            self.store.set(account, balance)
+        for changes in self.prepared_transactions.values():
+            self._reserve(changes, 1)
+        self.wal = WriteAheadLog(self.wal_file)
+        if not records and self.account_name not in self.store:
+            self._ensure_account_file()
+            with open(self.account_file, "r") as f:
+                balance = int(f.read().strip())
+            self.wal.sync(("set", {self.account_name: balance}))
+            self.store.set(self.account_name, balance)
+        self._log(f"Recovered {len(self.store)} accounts ({self.account_name}={self.store.get(self.account_name)}) "
+                  f"from {len(records)} WAL records")
+        for tx_id, changes in self.prepared_transactions.items():
+            self._log(f"  In-doubt tx_id={tx_id} (prepared changes={changes}), waiting for COMMIT or ABORT")
+
+    def _checkpoint_loop(self):
+        while True:
+            time.sleep(CHECKPOINT_INTERVAL)
+            try:
+                self._checkpoint()
+            except Exception as e:
+                self._log(f"Checkpoint failed: {e}", ERROR)
+
+    def _checkpoint(self):
+        """
+        Once the WAL is long, flush the store to disk and rewrite the WAL with only
+        the in-doubt transactions. Also copies account A's balance to the account file.
+        """
+        if self.wal.records > CHECKPOINT_RECORDS:
+            with self.locks.hold_all(), self.tx_lock:
+                self.store.flush()
+                self.wal.compact([("prepared", tx_id, changes) for tx_id, changes in self.prepared_transactions.items()])
+                self.stats.incr("wal_checkpoints")
+        balance = self.store.get(self.account_name)
+        if balance != self.written_balance:
+            # Only a copy for people to read, so no fsync; the rename keeps it whole
+            tmp = self.account_file + ".tmp"
+            with open(tmp, "w") as f:
+                f.write(str(balance) + "\n")
+            os.replace(tmp, self.account_file)
+            self.written_balance = balance
+
+    def _reserve(self, changes, sign):
+        """Add (sign=1) or remove (sign=-1) the debits in changes from the money promised away."""
+        for account, delta in changes.items():
+            if delta < 0:
+                self.reserved[account] = self.reserved.get(account, 0) + sign * delta
+
+    def _changes_for(self, tx_type, params):
+        """{account: change} that tx_type makes on this node, or None for an unknown tx_type."""
+        if tx_type == "T1_TRANSFER_100":
+            # For account A: subtract 100
+            return {self.account_name: -100}
+        elif tx_type == "T2_BONUS":
+            # Add bonus to A (same bonus as B). Coordinator provides the bonus value
+            return {self.account_name: int(params.get("bonus", 0))}
+        elif tx_type == "UPDATE":
+            # Any accounts: params["changes"] maps each participant to {account: change}
+            changes = params.get("changes", {}).get(self.account_name, {})
+            return {str(account): int(delta) for account, delta in changes.items()}
+        return None
+
+    def _dispatch(self, method, params):
+        """
+        SimpleXMLRPCServer calls this for every request instead of looking
+        the method up itself, so each RPC is timed in one place.
+        """
+        func = None if method.startswith("_") else getattr(self, method, None)
+        if not callable(func):
+            raise Exception(f'method "{method}" is not supported')
+        with self.stats.timer("rpc." + method):
+            return func(*params)
 
     # ---------- RPC methods ----------
     
-    def get_balance(self):
-        """Thread safe read of the account balance."""
-        with self.lock:
-            bal = self._read_balance()
-            self._log(f"get_balance -> {bal}")
-            return bal
-
-    def set_balance(self, new_value):
+    def get_balance(self, account=None):
+        """Balance of account (default: A). Reading one dict entry needs no lock."""
+        account = account or self.account_name
+        bal = self.store.get(account)
+        self._log(f"get_balance({account}) -> {bal}", DEBUG)
+        return bal
+
+    def set_balance(self, new_value, account=None):
         """
         Helper to initialize scenarios (200/300 or 90/50).
         Based on the assignment description.
         """
-        with self.lock:
-            self._write_balance(int(new_value))
-            self._log(f"set_balance({new_value})")
+        account = account or self.account_name
+        with self.locks.hold([account]):
+            # Logged and on disk before the store changes, so the store is never ahead of the WAL
+            self.wal.sync(("set", {account: int(new_value)}))
+            self.store.set(account, int(new_value))
+            self._log(f"set_balance({new_value}) for {account}")
         return True
 
     def prepare(self, transaction_id, tx_type, params):
         """
         Phase 1 of 2PC: vote YES/NO and record prepared state.
-        tx_type: 'T1_TRANSFER_100' or 'T2_BONUS'
-        params: dictionary, e.g. {'bonus': 40}
+        tx_type: 'T1_TRANSFER_100', 'T2_BONUS' or 'UPDATE'
+        params: dictionary, e.g. {'bonus': 40} or {'changes': {'A': {'alice': -5}, 'B': {'bob': 5}}}
         Return True for YES, False for NO.
         Called by the Coordinator
         """
-        with self.lock:
-            self._log(f"PREPARE received: tx_id={transaction_id}, type={tx_type}, params={params}")
+        changes = self._changes_for(tx_type, params or {})
+        # Only the locks of the accounts this transaction touches
+        with self.locks.hold(changes or ()):
+            self._log(f"PREPARE received: tx_id={transaction_id}, type={tx_type}, params={params}", tx_id=transaction_id, tx_type=tx_type)
 
             # Simulating crash before vote
             if CRASH_BEFORE_VOTE:
-                self._log("Simulating crash BEFORE vote (sleeping forever)...")
+                self._log("Simulating crash BEFORE vote (sleeping forever)...", WARNING)
                 while True:
                     time.sleep(1000)
 
-            current_balance = self._read_balance()
-
-            if tx_type == "T1_TRANSFER_100":
-                # For account A: subtract 100, but only there is enough
-                if current_balance < 100:
-                    self._log(f"VOTE ABORT (insufficient funds: {current_balance})")
-                    return False    # To vote "no"
-                new_balance = current_balance - 100
-
-            elif tx_type == "T2_BONUS":
-                # Add bonus to A (same bonus as B). Coordinator provides the bonus value
-                bonus = int(params.get("bonus", 0))
-                new_balance = current_balance + bonus
-
-            else:
+            if changes is None:
                 self._log(f"Unknown tx_type={tx_type}, VOTE ABORT")
+                self.stats.incr("votes_no")
                 return False    # To vote "np"
 
-            # Record prepared new balance (but DO NOT write to account file yet)
-            self.prepared_transactions[transaction_id] = new_balance
-            self._log(f"VOTE COMMIT, prepared new_balance={new_balance} for tx_id={transaction_id}")
+            bad = [account for account in changes if not valid_name(account)]
+            if bad:
+                # Could never be stored, so the commit would fail
+                self._log(f"VOTE ABORT (account names must be 1 to {NAME_BYTES} bytes: {bad})")
+                self.stats.incr("votes_no")
+                return False    # To vote "no"
+
+            for account, delta in changes.items():
+                # Subtract only if there is enough
+                # Money already promised to other prepared transactions does not count
+                available = self.store.get(account) + self.reserved.get(account, 0)
+                if delta < 0 and available + delta < 0:
+                    self._log(f"VOTE ABORT (insufficient funds in {account}: {available})")
+                    self.stats.incr("votes_no")
+                    return False    # To vote "no"
+
+            with self.tx_lock:
+                if transaction_id in self.aborted_transactions:
+                    self._log(f"VOTE ABORT (tx_id={transaction_id} was already aborted)")
+                    self.stats.incr("votes_no")
+                    return False
+                # Record the prepared changes in the WAL (the balances themselves only change on COMMIT)
+                # Changes rather than new balances, so transactions prepared at the same time do not overwrite each other
+                self.prepared_transactions[transaction_id] = changes
+            self._reserve(changes, 1)
+            lsn = self.wal.append(("prepared", transaction_id, changes))
+            self.stats.incr("votes_yes")
+            self._log(f"VOTE COMMIT, prepared changes={changes} for tx_id={transaction_id}", tx_id=transaction_id, vote=True)
 
             # Simulating crash after vote
             if CRASH_AFTER_VOTE:
-                self._log("Simulating crash AFTER vote (sleeping forever)...")
+                self._log("Simulating crash AFTER vote (sleeping forever)...", WARNING)
+                self.wal.wait(lsn)    # The YES vote reached the disk before the "crash"
                 while True:
                     time.sleep(1000)
 
-            return True    # To vote "yes"
+        # Vote YES only once the prepare is on disk. Waiting outside the lock lets
+        # concurrent transactions append meanwhile and share one fsync
+        self.wal.wait(lsn)
+        return True    # To vote "yes"
 
     def commit(self, transaction_id):
         """Phase 2 COMMIT: finalize the prepared value."""
-        with self.lock:
-            self._log(f"COMMIT received for tx_id={transaction_id}")
-            if transaction_id not in self.prepared_transactions:
-                self._log(f"  No prepared state for tx_id={transaction_id}, ignoring.")
-                return False
-
-            new_balance = self.prepared_transactions.pop(transaction_id)
-            self._write_balance(new_balance)
-            self._log(f"  Commit applied. New balance={new_balance}")
-            return True
+        self._log(f"COMMIT received for tx_id={transaction_id}", tx_id=transaction_id)
+        with self.tx_lock:
+            changes = self.prepared_transactions.get(transaction_id)
+        if changes is not None:
+            with self.locks.hold(changes):
+                with self.tx_lock:
+                    changes = self.prepared_transactions.get(transaction_id)
+                if changes is not None:
+                    # Everything that can fail (new balances, records for new accounts) happens
+                    # first; if it raises, the transaction is still prepared and nothing changed.
+                    # Only this thread can remove it now, since that needs these account locks
+                    balances = {account: self.store.get(account) + delta for account, delta in changes.items()}
+                    for account in balances:
+                        self.store.ensure(account)
+                    # The commit record is on disk before the store changes: the OS may write the
+                    # store back at any time, and after a crash the store must not already hold
+                    # balances of a transaction the WAL still shows as prepared. Transactions on
+                    # other accounts keep appending meanwhile and share the fsync
+                    self.wal.sync(("commit", transaction_id, balances))
+                    with self.tx_lock:
+                        del self.prepared_transactions[transaction_id]
+                    for account, balance in balances.items():
+                        self.store.set(account, balance)
+                    self._reserve(changes, -1)
+                    self.stats.incr("commits")
+                    self._log(f"  Commit applied. New balances={balances}")
+        if changes is None:
+            self._log(f"  No prepared state for tx_id={transaction_id}, ignoring.")
+            self.stats.incr("unknown_commits")
+            return False
+        return True
 
     def abort(self, transaction_id):
         """Phase 2 ABORT: discard any prepared state."""
-        with self.lock:
-            self._log(f"ABORT received for tx_id={transaction_id}")
-            if transaction_id in self.prepared_transactions:
-                self.prepared_transactions.pop(transaction_id)
-                self._log("  Prepared state discarded.")
-            else:
+        self._log(f"ABORT received for tx_id={transaction_id}", tx_id=transaction_id)
+        self.stats.incr("aborts")
+        with self.tx_lock:
+            changes = self.prepared_transactions.get(transaction_id)
+            if changes is None:
+                # The PREPARE may still be on its way; make sure it votes NO
+                self.aborted_transactions[transaction_id] = True
+                if len(self.aborted_transactions) > ABORTED_MEMORY:
+                    self.aborted_transactions.popitem(last=False)
                 self._log("  No prepared state to discard.")
+                return True
+        with self.locks.hold(changes):
+            with self.tx_lock:
+                changes = self.prepared_transactions.pop(transaction_id, None)
+            if changes is None:
+                return True
+            self._reserve(changes, -1)
+            lsn = self.wal.append(("abort", transaction_id))
+            self._log("  Prepared state discarded.")
+        self.wal.wait(lsn)
         return True
 
+    def get_stats(self):
+        """Counters, latency histograms and gauges for this participant (see stats.py)."""
+        snapshot = self.stats.snapshot()
+        snapshot["node"] = self.account_name
+        return snapshot
+
+    def set_stats_mode(self, mode):
+        """Switch instrumentation between "off", "counters" and "full" at runtime."""
+        self.stats.set_mode(mode)
+        self.log.console = self.stats.tracing
+        return self.stats.mode
+
+    def set_log_level(self, level):
+        """Keep only log lines at or above level ("DEBUG", "INFO", "WARNING" or "ERROR")."""
+        return self.log.set_level(level)
+
 def main():
-    # Create the server bound to the HOST and PORT
-    server = SimpleXMLRPCServer((HOST, PORT), allow_none=True, logRequests=True)
-    participant = AccountParticipant(ACCOUNT_NAME, ACCOUNT_FILE, LOG_FILE)
+    # Create the server bound to the HOST and PORT; each coordinator connection gets its own thread
+    server = ThreadedXMLRPCServer((HOST, PORT), allow_none=True, logRequests=True)
+    participant = AccountParticipant(ACCOUNT_NAME, ACCOUNT_FILE, STORE_FILE, WAL_FILE, LOG_FILE)
+    server.log = participant.log             # HTTP request lines go to the log at DEBUG level
     server.register_instance(participant)    # Methods become XML-RPC endpoints
     
     # Startup message and looping
@@ -0,0 +1,97 @@
+# rpc.py
+#
+# XML-RPC plumbing shared by the coordinator and the participants:
+#   - ThreadedXMLRPCServer: serves every connection on its own thread, and keeps
+#     HTTP/1.1 connections open between requests
+#   - ProxyPool: a pool of keep-alive ServerProxy objects for one remote node,
+#     safe to use from many threads at once
+#   - TimeoutTransport: makes calls give up after a number of seconds
+
+from xmlrpc.server import SimpleXMLRPCServer, SimpleXMLRPCRequestHandler
+from xmlrpc.client import ServerProxy, Transport
+from socketserver import ThreadingMixIn
+from contextlib import contextmanager
+import threading
+
+# Most connections kept open to each remote node; more callers than this wait for a free one
+POOL_SIZE = 16
+
+
+class KeepAliveRequestHandler(SimpleXMLRPCRequestHandler):
+    # HTTP/1.0 (the default) closes the connection after every request
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        # Into the node's log (logger.py) at DEBUG level when the server has one, else stderr
+        log = getattr(self.server, "log", None)
+        if log is None:
+            return super().log_message(format, *args)
+        log.debug(f"{self.address_string()} {format % args}")
+
+
+class ThreadedXMLRPCServer(ThreadingMixIn, SimpleXMLRPCServer):
+    """SimpleXMLRPCServer that handles each connection on its own thread."""
+    daemon_threads = True
+    request_queue_size = 128
+
+    def __init__(self, addr, **kwargs):
+        kwargs.setdefault("requestHandler", KeepAliveRequestHandler)
+        super().__init__(addr, **kwargs)
+
+
+# xmlrpc Transport whose connections give up after timeout seconds,
+# so a hung node cannot block the caller
+class TimeoutTransport(Transport):
+    def __init__(self, timeout=None, **kwargs):
+        super().__init__(**kwargs)
+        self.timeout = timeout
+
+    def make_connection(self, host):
+        conn = super().make_connection(host)
+        if self.timeout is not None:
+            conn.timeout = self.timeout
+        return conn
+
+
+class ProxyPool:
+    """
+    Up to size ServerProxy objects for one URL. Each proxy keeps its HTTP/1.1
+    connection open between calls and is used by one thread at a time
+    (ServerProxy is not thread-safe), so concurrent callers each get their own.
+    """
+    def __init__(self, url, size=POOL_SIZE, timeout=None):
+        self.url = url
+        self._timeout = timeout
+        self._slots = threading.BoundedSemaphore(size)
+        self._lock = threading.Lock()
+        self._idle = []
+
+    @contextmanager
+    def proxy(self):
+        self._slots.acquire()
+        try:
+            with self._lock:
+                proxy = self._idle.pop() if self._idle else None
+            if proxy is None:
+                proxy = ServerProxy(self.url, allow_none=True, transport=TimeoutTransport(self._timeout))
+            try:
+                yield proxy
+            except Exception:
+                # The connection may be half-way through a request; start over next time
+                proxy("close")()
+                raise
+            with self._lock:
+                self._idle.append(proxy)
+        finally:
+            self._slots.release()
+
+    def call(self, method, *args):
+        """Run method(*args) on the remote node over a pooled connection."""
+        with self.proxy() as proxy:
+            return getattr(proxy, method)(*args)
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for proxy in idle:
+            proxy("close")()
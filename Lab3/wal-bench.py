@@ -0,0 +1,87 @@
+# Benchmark: durable participant commits, fsync per WAL record vs. group commit.
+#
+# Runs an AccountParticipant in this process (no RPC), with its files in a
+# temporary directory. Each of T threads repeatedly runs prepare() + commit()
+# for its own transaction, the way concurrent coordinator requests do, and
+# every call returns only once its WAL record is on disk. Reports committed
+# transactions per second, fsyncs per transaction and p50/p99 latency.
+#
+# Run:  python3 wal-bench.py [--threads 1 8 64] [--transactions 2000] [--dir .]
+
+import argparse
+import os
+import tempfile
+import time
+from threading import Thread
+
+from participantA import AccountParticipant
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return 0.0
+    k = min(len(sorted_values) - 1, int(round(p / 100 * (len(sorted_values) - 1))))
+    return sorted_values[k]
+
+
+def run(directory, group_commit, threads, transactions):
+    tag = f"{'group' if group_commit else 'per-op'}-{threads}"
+    files = [os.path.join(directory, f"bench-{tag}{ext}") for ext in (".txt", ".dat", ".wal", ".log")]
+    for path in files:
+        if os.path.exists(path):
+            os.remove(path)
+    participant = AccountParticipant("A", *files, stats_mode="off")
+    participant.wal.group_commit = group_commit
+    fsyncs_before = participant.wal.fsyncs
+    per_thread = transactions // threads
+    latencies = [[] for _ in range(threads)]
+
+    def worker(t):
+        for i in range(per_thread):
+            start = time.perf_counter()
+            tx_id = f"{t}-{i}"
+            participant.prepare(tx_id, "T2_BONUS", {"bonus": 1})
+            participant.commit(tx_id)
+            latencies[t].append(time.perf_counter() - start)
+
+    workers = [Thread(target=worker, args=(t,)) for t in range(threads)]
+    start = time.perf_counter()
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    elapsed = time.perf_counter() - start
+    done = per_thread * threads
+    assert participant.get_balance() == done
+    participant.wal.close()
+    for path in files:
+        if os.path.exists(path):
+            os.remove(path)
+
+    all_latencies = sorted(l for ls in latencies for l in ls)
+    return {
+        "tx_per_s": done / elapsed,
+        "fsyncs_per_tx": (participant.wal.fsyncs - fsyncs_before) / done,
+        "p50_ms": percentile(all_latencies, 50) * 1e3,
+        "p99_ms": percentile(all_latencies, 99) * 1e3,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="participant commits: fsync per record vs group commit")
+    parser.add_argument("--threads", type=int, nargs="+", default=[1, 8, 64])
+    parser.add_argument("--transactions", type=int, default=2000, help="transactions per run")
+    parser.add_argument("--dir", help="directory for the WAL (default: a temp dir; use the real disk to measure fsync)")
+    args = parser.parse_args()
+
+    directory = args.dir or tempfile.mkdtemp(prefix="wal-bench-")
+    print(f"{'mode':<8} {'threads':>7} {'tx/s':>9} {'fsync/tx':>9} {'p50 ms':>8} {'p99 ms':>8}")
+    for threads in args.threads:
+        for group_commit in (False, True):
+            r = run(directory, group_commit, threads, args.transactions)
+            print(f"{'group' if group_commit else 'per-op':<8} {threads:>7} {r['tx_per_s']:>9.0f} "
+                  f"{r['fsyncs_per_tx']:>9.2f} {r['p50_ms']:>8.2f} {r['p99_ms']:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,195 @@
+# wal.py
+#
+# Append-only write-ahead log for a participant's accounts, with group commit.
+# Each record is a plain tuple:
+#
+#   ("set", {account: balance})             set_balance()
+#   ("prepared", tx_id, {account: change})  a YES vote: the changes to apply if tx_id commits
+#   ("commit", tx_id, {account: balance})   tx_id committed; the balances after it (applied once this is on disk)
+#   ("abort", tx_id)                        a prepared transaction was rolled back
+#
+# Balances are logged as absolute values, so replaying a record twice, or over
+# an account file that already has it, gives the same result.
+#
+# stored as  length (u32) | crc32 of payload (u32) | marshal payload.
+#
+# append() only buffers the record and returns its log sequence number (LSN);
+# wait(lsn) returns once that record is on disk. Whichever waiter finds no
+# flush in progress writes and fsyncs everything buffered so far, so
+# concurrent transactions share a single fsync (group commit).
+
+import os
+import marshal
+import struct
+import zlib
+from threading import Lock, Condition
+
+RECORD_HEADER = struct.Struct("!II")
+MARSHAL_VERSION = 4
+
+
+def encode_record(record):
+    payload = marshal.dumps(record, MARSHAL_VERSION)
+    return RECORD_HEADER.pack(len(payload), zlib.crc32(payload)) + payload
+
+
+def read_records(path):
+    """
+    Return (records, valid_length) for the log at path. Reading stops at the
+    first torn or corrupt record, which is what a crash mid-write leaves.
+    """
+    if not os.path.exists(path):
+        return [], 0
+    with open(path, "rb") as f:
+        data = f.read()
+    records = []
+    pos = 0
+    while pos + RECORD_HEADER.size <= len(data):
+        length, crc = RECORD_HEADER.unpack_from(data, pos)
+        start = pos + RECORD_HEADER.size
+        payload = data[start:start + length]
+        if len(payload) < length or zlib.crc32(payload) != crc:
+            break
+        try:
+            records.append(marshal.loads(payload))
+        except (ValueError, EOFError, TypeError):
+            break
+        pos = start + length
+    return records, pos
+
+
+def replay(records):
+    """
+    Rebuild (balances, prepared) from records: {account: balance} for every
+    account the records changed, and {tx_id: {account: change}} for
+    transactions that voted YES but never heard COMMIT or ABORT (in doubt).
+    """
+    balances = {}
+    prepared = {}
+    for record in records:
+        kind = record[0]
+        if kind == "set":
+            balances.update(record[1])
+        elif kind == "prepared":
+            prepared[record[1]] = record[2]
+        elif kind == "commit":
+            prepared.pop(record[1], None)
+            balances.update(record[2])
+        elif kind == "abort":
+            prepared.pop(record[1], None)
+    return balances, prepared
+
+
+def write_atomic(path, data):
+    """Replace the file at path with data, all or nothing (temp file, fsync, rename)."""
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+    try:
+        fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+class WriteAheadLog:
+    def __init__(self, path, group_commit=True):
+        """
+        Opens (or creates) the log at path, dropping any torn tail left by
+        a crash. Use read_records() first to replay what is already there.
+        With group_commit=False every append is written and fsynced on its
+        own, which is only useful for comparison.
+        """
+        self.path = path
+        self.group_commit = group_commit
+        _, valid_length = read_records(path)
+        self._f = open(path, "ab")
+        if self._f.tell() != valid_length:
+            self._f.truncate(valid_length)
+            self._f.seek(valid_length)
+        self._cond = Condition(Lock())
+        self._buffer = []
+        self._appended_lsn = 0
+        self._durable_lsn = 0
+        self._flushing = False
+        self.records = 0          # records in the file (and buffered) since it was opened or compacted
+        self.fsyncs = 0
+
+    def append(self, record):
+        """Buffer a record and return its LSN; call wait(lsn) before replying to anyone."""
+        data = encode_record(record)
+        with self._cond:
+            self.records += 1
+            self._appended_lsn += 1
+            if not self.group_commit:
+                self._f.write(data)
+                self._f.flush()
+                os.fsync(self._f.fileno())
+                self.fsyncs += 1
+                self._durable_lsn = self._appended_lsn
+            else:
+                self._buffer.append(data)
+            return self._appended_lsn
+
+    def wait(self, lsn):
+        """Block until every record up to lsn has been fsynced."""
+        with self._cond:
+            while self._durable_lsn < lsn:
+                if self._flushing:
+                    # Someone else's fsync is in progress; it (or the next one) covers us
+                    self._cond.wait()
+                    continue
+                self._flushing = True
+                data = b"".join(self._buffer)
+                self._buffer = []
+                target = self._appended_lsn
+                self._cond.release()
+                try:
+                    self._f.write(data)
+                    self._f.flush()
+                    os.fsync(self._f.fileno())
+                finally:
+                    self._cond.acquire()
+                    self._flushing = False
+                    self._cond.notify_all()
+                self.fsyncs += 1
+                self._durable_lsn = target
+
+    def sync(self, record):
+        """append() and wait() in one call."""
+        self.wait(self.append(record))
+
+    def compact(self, records):
+        """
+        Atomically replace the whole log with records, which must already
+        capture the effect of every record appended so far (the caller
+        blocks appends while it builds them). Everything appended counts
+        as durable afterwards.
+        """
+        with self._cond:
+            while self._flushing:
+                self._cond.wait()
+            self._f.close()
+            write_atomic(self.path, b"".join(encode_record(record) for record in records))
+            self._f = open(self.path, "ab")
+            self._buffer = []
+            self.records = len(records)
+            self._durable_lsn = self._appended_lsn
+            self._cond.notify_all()
+
+    def backlog(self):
+        """Records appended but not yet on disk."""
+        with self._cond:
+            return self._appended_lsn - self._durable_lsn
+
+    def close(self):
+        with self._cond:
+            self._f.close()